@@ -0,0 +1,60 @@
+"""Check that records parsed from ISO 2709 are the same as records parsed
+from the text rendering of PyZ3950, and compare the time taken by both
+parsers, on a dump of MARC records (ISO 2709 records concatenated).
+
+    python -m benchmarks.compare_parsers records.mrc [--encoding marc8]
+"""
+import argparse
+import sys
+import time
+
+from PyZ3950 import zmarc
+
+from moxie_library import iso2709, marc8
+from moxie_library.providers.oxford_z3950 import USMARCSearchResult
+
+
+def read_records(path):
+    with open(path, 'rb') as f:
+        dump = f.read()
+    for record in dump.split(iso2709.RECORD_TERMINATOR):
+        if record.strip():
+            yield record + iso2709.RECORD_TERMINATOR
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('dump')
+    parser.add_argument('--encoding', default='marc8')
+    args = parser.parse_args()
+
+    decode = marc8.decode if args.encoding == 'marc8' else None
+    records = list(read_records(args.dump))
+    texts = [str(zmarc.MARC(record, strict=0)) for record in records]
+
+    mismatches = 0
+    for record, text in zip(records, texts):
+        expected = USMARCSearchResult.parse_text(text, decode)
+        parsed = iso2709.parse(record, decode)
+        if parsed != expected:
+            mismatches += 1
+            sys.stdout.write("Mismatch for record {0}\n".format(expected[0]))
+
+    started = time.time()
+    for text in texts:
+        USMARCSearchResult.parse_text(text, decode)
+    text_time = time.time() - started
+
+    started = time.time()
+    for record in records:
+        iso2709.parse(record, decode)
+    binary_time = time.time() - started
+
+    sys.stdout.write("{0} records, {1} mismatches\n".format(len(records), mismatches))
+    sys.stdout.write("text parser: {0:.1f}ms (excluding text rendering), ISO 2709 parser: {1:.1f}ms\n".format(
+        text_time * 1000, binary_time * 1000))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Fake Aleph X-server answering circ-status requests for canned records,
+with configurable latency and error injection.
+
+    python -m benchmarks.loadtest.fake_aleph --port 8100 --latency 0.1
+"""
+import argparse
+import random
+import threading
+import time
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qs
+
+from moxie_library.tests.records import circ_status
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class CircStatusHandler(BaseHTTPRequestHandler):
+
+    latency = 0.0
+    jitter = 0.0
+    errors = 0.0
+
+    def do_GET(self):
+        time.sleep(max(0, random.gauss(self.latency, self.jitter)))
+        query = parse_qs(urlparse(self.path).query)
+        if random.random() < self.errors or query.get('op') != ['circ-status']:
+            self.send_error(500)
+            return
+        try:
+            body = circ_status(int(query['sys_no'][0]))
+        except (KeyError, ValueError):
+            self.send_error(400)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, latency=0.0, jitter=0.0, errors=0.0):
+    """Serve forever in a background thread
+    :param port: port to listen to (0 for any)
+    :return server
+    """
+    handler = type('ConfiguredCircStatusHandler', (CircStatusHandler,),
+                   {'latency': latency, 'jitter': jitter, 'errors': errors})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', type=float, default=0.0, help="mean latency (seconds) of answers")
+    parser.add_argument('--jitter', type=float, default=0.0, help="standard deviation of the latency")
+    parser.add_argument('--errors', type=float, default=0.0, help="probability of answering an error")
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.jitter, args.errors)
+    while True:
+        time.sleep(3600)
+
+
+if __name__ == '__main__':
+    main()
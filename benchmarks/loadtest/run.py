@@ -0,0 +1,121 @@
+"""Drive the library blueprint against local fake Z39.50 and Aleph servers
+and report throughput and latency percentiles for search, item and
+availability requests at several levels of concurrency.
+
+    python -m benchmarks.loadtest.run --concurrency 1 4 16 --requests 200 --z3950-latency 0.02
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+
+from flask import Flask
+
+from moxie.core.cache import cache
+from moxie_library import create_blueprint
+
+from benchmarks.loadtest import fake_aleph
+from moxie_library.tests import fake_z3950
+from moxie_library.tests.records import control_number
+
+SCENARIOS = {
+    'search': lambda i: '/library/search?title=load+test+{0}&count=10'.format(i % 50),
+    'item': lambda i: '/library/item:{0}/?availability=false'.format(control_number(i % 500)),
+    'availability': lambda i: '/library/item:{0}/?availability=true'.format(control_number(i % 500)),
+}
+
+
+def create_app(z3950_port, aleph_port, cache_type='null'):
+    app = Flask(__name__)
+    app.config['SERVICES'] = {
+        'library': {
+            'LibrarySearchService': {
+                'search_provider_config': {
+                    'moxie_library.providers.oxford_z3950.Z3950': {
+                        'host': '127.0.0.1',
+                        'port': z3950_port,
+                        'database': 'loadtest',
+                        'aleph_url': 'http://127.0.0.1:{0}/X'.format(aleph_port),
+                    }
+                }
+            }
+        }
+    }
+    cache.init_app(app, config={'CACHE_TYPE': cache_type})
+    app.register_blueprint(create_blueprint('library', {}), url_prefix='/library')
+    return app
+
+
+def percentile(latencies, p):
+    index = min(len(latencies) - 1, int(len(latencies) * p / 100.0))
+    return latencies[index]
+
+
+def run(app, scenario, concurrency, requests):
+    """Send requests of a scenario from concurrent clients
+    :return elapsed time, sorted latencies, number of errors
+    """
+    path = SCENARIOS[scenario]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client():
+        test_client = app.test_client()
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.time()
+            response = test_client.get(path(i), headers={'Accept': 'application/hal+json'})
+            latency = time.time() - started
+            with lock:
+                latencies.append(latency)
+                if response.status_code != 200:
+                    errors[0] += 1
+
+    started = time.time()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - started, sorted(latencies), errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario and concurrency")
+    parser.add_argument('--scenarios', nargs='+', default=sorted(SCENARIOS), choices=sorted(SCENARIOS))
+    parser.add_argument('--cache', default='null', help="type of cache (null to measure uncached requests)")
+    parser.add_argument('--hits', type=int, default=200)
+    parser.add_argument('--z3950-latency', type=float, default=0.0)
+    parser.add_argument('--z3950-jitter', type=float, default=0.0)
+    parser.add_argument('--z3950-errors', type=float, default=0.0)
+    parser.add_argument('--aleph-latency', type=float, default=0.0)
+    parser.add_argument('--aleph-jitter', type=float, default=0.0)
+    parser.add_argument('--aleph-errors', type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    z3950_server = fake_z3950.serve(0, args.hits, args.z3950_latency, args.z3950_jitter, args.z3950_errors)
+    aleph_server = fake_aleph.serve(0, args.aleph_latency, args.aleph_jitter, args.aleph_errors)
+    app = create_app(z3950_server.getsockname()[1], aleph_server.server_address[1], args.cache)
+
+    sys.stdout.write("{0:<14}{1:>6}{2:>10}{3:>10}{4:>10}{5:>10}{6:>8}\n".format(
+        'scenario', 'conc.', 'req/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'errors'))
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            elapsed, latencies, errors = run(app, scenario, concurrency, args.requests)
+            sys.stdout.write("{0:<14}{1:>6}{2:>10.1f}{3:>10.1f}{4:>10.1f}{5:>10.1f}{6:>8}\n".format(
+                scenario, concurrency, len(latencies) / elapsed,
+                percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000, errors))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Measure the time taken by a new worker to import the library blueprint
+and create it, each measure is done in a fresh interpreter.
+
+    python -m benchmarks.startup [--runs 10]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = ('PyZ3950.zoom', 'lxml.etree', 'requests', 'moxie.places.services')
+
+MEASURE = """
+import json, sys, time
+started = time.time()
+from moxie_library import create_blueprint
+imported = time.time()
+create_blueprint('library', {})
+created = time.time()
+print(json.dumps({'import': imported - started, 'create': created - imported,
+                  'loaded': [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure():
+    output = subprocess.check_output([sys.executable, '-c', MEASURE])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    measures = [measure() for _ in range(args.runs)]
+    imports = [m['import'] for m in measures]
+    creates = [m['create'] for m in measures]
+    sys.stdout.write("import moxie_library: median {0:.1f}ms, max {1:.1f}ms\n".format(
+        median(imports) * 1000, max(imports) * 1000))
+    sys.stdout.write("create_blueprint: median {0:.1f}ms, max {1:.1f}ms\n".format(
+        median(creates) * 1000, max(creates) * 1000))
+    sys.stdout.write("heavy modules loaded at start-up: {0}\n".format(
+        ', '.join(measures[-1]['loaded']) or 'none'))
+
+
+if __name__ == '__main__':
+    main()
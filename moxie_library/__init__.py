@@ -2,7 +2,7 @@ from flask import Blueprint, request
 from flask.helpers import make_response
 
 from moxie.core.representations import HALRepresentation
-from .views import Search, ResourceDetail
+from .views import Search, ResourceDetail, Export, Suggestions
 
 
 def create_blueprint(blueprint_name, conf):
@@ -12,6 +12,10 @@ def create_blueprint(blueprint_name, conf):
 
     library_blueprint.add_url_rule('/search',
             view_func=Search.as_view('search'))
+    library_blueprint.add_url_rule('/suggest',
+            view_func=Suggestions.as_view('suggest'))
+    library_blueprint.add_url_rule('/export',
+            view_func=Export.as_view('export'))
     library_blueprint.add_url_rule('/item:<string:id>/',
             view_func=ResourceDetail.as_view('item'))
     return library_blueprint
@@ -24,6 +28,10 @@ def get_routes():
     representation.add_link('self', '{bp}'.format(bp=path))
     representation.add_link('hl:search', '{bp}search?title={{title}}&author={{author}}&isbn={{isbn}}'.format(bp=path),
                             templated=True, title='Search')
+    representation.add_link('hl:export', '{bp}export?title={{title}}&author={{author}}&isbn={{isbn}}'.format(bp=path),
+                            templated=True, title='Export')
+    representation.add_link('hl:suggest', '{bp}suggest?q={{q}}'.format(bp=path),
+                            templated=True, title='Suggestions')
     representation.add_link('hl:item', '{bp}item:{{id}}'.format(bp=path),
                             templated=True, title='POI detail')
     response = make_response(representation.as_json(), 200)
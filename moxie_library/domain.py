@@ -90,6 +90,13 @@ class LibrarySearchResult(object):
         AVAIL_AVAILABLE: 'available',
     }
 
+    FIELDS = frozenset(('id', 'title', 'author', 'publisher', 'description', 'edition',
+                        'copies', 'holdings', 'isbns', 'issns'))
+    """
+    @cvar FIELDS: Names of the fields which can be requested (projection)
+    @type FIELDS: frozenset
+    """
+
     def __unicode__(self):
         return self.title
 
@@ -121,6 +128,36 @@ class LibrarySearchQuery:
 
         return isbn
 
+    @classmethod
+    def _isbn_forms(cls, isbn):
+        """Equivalent ISBN-13 and ISBN-10 forms of a cleaned ISBN, ISBN-13
+        starting with 979 have no ISBN-10 form
+        :return tuple of ISBNs, ISBN-13 first
+        :raise LibrarySearchQuery.InconsistentQuery: if the ISBN is not valid
+        """
+        if len(isbn) == 10 and isbn[:9].isdigit() and isbn[9] in '0123456789X':
+            if cls._isbn10_check_digit(isbn[:9]) != isbn[9]:
+                raise cls.InconsistentQuery("Invalid ISBN: wrong check digit.")
+            isbn13 = '978' + isbn[:9]
+            return isbn13 + cls._isbn13_check_digit(isbn13), isbn
+        if len(isbn) == 13 and isbn.isdigit():
+            if cls._isbn13_check_digit(isbn[:12]) != isbn[12]:
+                raise cls.InconsistentQuery("Invalid ISBN: wrong check digit.")
+            if isbn.startswith('978'):
+                return isbn, isbn[3:12] + cls._isbn10_check_digit(isbn[3:12])
+            return isbn,
+        raise cls.InconsistentQuery("Invalid ISBN: an ISBN has 10 or 13 digits.")
+
+    @staticmethod
+    def _isbn10_check_digit(digits):
+        check = (11 - sum((10 - i) * int(d) for i, d in enumerate(digits)) % 11) % 11
+        return 'X' if check == 10 else str(check)
+
+    @staticmethod
+    def _isbn13_check_digit(digits):
+        check = (10 - sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(digits)) % 10) % 10
+        return str(check)
+
     @staticmethod
     def _clean_input(input):
         """Remove stop words from the input
@@ -145,12 +182,13 @@ class LibrarySearchQuery:
         :param author: The author of the book to search for
         :type author: str or None
         :param isbn: an ISBN number to search for - can contain * in place of X.
+            Both ISBN-10 and ISBN-13 forms are searched for.
         :type isbn: str or None
         :param issn: an ISSN number to search for - can contain * in place of X.
         :type issn: str or None
         :raise LibrarySearchQuery.InconsistentQuery: If the query parameters are
             inconsistent (e.g., isbn specified alongside title and author, or no
-            queries present)
+            queries present) or the ISBN is not valid
         """
 
         if isbn and issn:
@@ -178,8 +216,10 @@ class LibrarySearchQuery:
 
         if isbn:
             self.isbn = self._clean_isbn(isbn)
+            self.isbns = self._isbn_forms(self.isbn)
         else:
             self.isbn = None
+            self.isbns = ()
 
         if issn:
             self.issn = self._clean_isbn(issn)
@@ -0,0 +1,82 @@
+"""Parsing of MARC records in their ISO 2709 exchange format, directly from
+the bytes sent by the server.
+"""
+
+LEADER_LENGTH = 24
+DIRECTORY_ENTRY_LENGTH = 12
+FIELD_TERMINATOR = b'\x1e'
+RECORD_TERMINATOR = b'\x1d'
+SUBFIELD_DELIMITER = b'\x1f'
+
+
+class ISO2709Error(ValueError):
+    pass
+
+
+def is_record(data):
+    """Whether data looks like an ISO 2709 record (lengths in the leader,
+    record length matching and record terminator), the text rendering of
+    PyZ3950 also starts with the leader
+    """
+    return (len(data) > LEADER_LENGTH and data[:5].isdigit() and int(data[:5]) == len(data)
+            and data[12:17].isdigit() and data.endswith(RECORD_TERMINATOR))
+
+
+def parse(data, decode=None):
+    """Parse an ISO 2709 record, control fields are ignored except the control
+    number (001)
+    :param data: record
+    :type data: str
+    :param decode: function to decode the content of subfields
+    :return control number, dict of tag -> list of fields, each field being a
+            dict of subfield code -> list of contents
+    :raise ISO2709Error: if the record is malformed
+    """
+    view = memoryview(data)
+    try:
+        base_address = int(view[12:17].tobytes())
+    except ValueError:
+        raise ISO2709Error("Invalid base address of data")
+    if base_address > len(data):
+        raise ISO2709Error("Base address of data beyond the end of the record")
+
+    control_number = None
+    metadata = {}
+    # the directory ends with a field terminator
+    directory = view[LEADER_LENGTH:base_address - 1]
+    for offset in range(0, len(directory) - DIRECTORY_ENTRY_LENGTH + 1, DIRECTORY_ENTRY_LENGTH):
+        entry = directory[offset:offset + DIRECTORY_ENTRY_LENGTH].tobytes()
+        try:
+            tag = int(entry[:3])
+            length = int(entry[3:7])
+            start = base_address + int(entry[7:12])
+        except ValueError:
+            raise ISO2709Error("Invalid directory entry {entry!r}".format(entry=entry))
+        # the field terminator is not part of the field
+        field = view[start:start + length - 1].tobytes()
+
+        if tag < 10:
+            if tag == 1:
+                control_number = field
+            continue
+
+        # two indicators, then subfields
+        if field[2:3] != SUBFIELD_DELIMITER:
+            continue
+        subfields = field[3:].split(SUBFIELD_DELIMITER)
+        m = {}
+        for subfield in subfields:
+            if not subfield:
+                continue
+            code, content = subfield[:1], subfield[1:]
+            if decode:
+                content = decode(content)
+            if code in m:
+                m[code].append(content)
+            else:
+                m[code] = [content]
+        if tag in metadata:
+            metadata[tag].append(m)
+        else:
+            metadata[tag] = [m]
+    return control_number, metadata
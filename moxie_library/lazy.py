@@ -0,0 +1,30 @@
+import importlib
+import threading
+
+
+class LazyModule(object):
+    """Stands for a module which is only imported when one of its attributes
+    is first accessed, to keep heavy dependencies out of start-up
+    """
+
+    def __init__(self, name, on_import=None):
+        """
+        :param name: absolute name of the module
+        :param on_import: function called with the module once imported
+        """
+        self.__name = name
+        self.__on_import = on_import
+        self.__module = None
+        self.__lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        module = self.__module
+        if module is None:
+            with self.__lock:
+                if self.__module is None:
+                    module = importlib.import_module(self.__name)
+                    if self.__on_import:
+                        self.__on_import(module)
+                    self.__module = module
+                module = self.__module
+        return getattr(module, attr)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Decoding of MARC-8 encoded strings to unicode using precomputed tables.
+
+Supported character sets are Basic Latin (ASCII), Extended Latin (ANSEL),
+Greek symbols, subscripts, superscripts and Basic Cyrillic. Characters from
+other sets (e.g. East Asian) are replaced by U+FFFD.
+"""
+import unicodedata
+
+ESC = 0x1b
+REPLACEMENT = u'�'
+
+# size of the cache of decoded strings, it is cleared when full
+CACHE_SIZE = 10000
+
+BASIC_LATIN = dict((c, unichr(c)) for c in range(0x20, 0x7f))
+
+EXTENDED_LATIN = {
+    0x88: u'', 0x89: u'',  # non-sort begin/end
+    0x8d: u'‍', 0x8e: u'‌',
+    0xa1: u'Ł', 0xa2: u'Ø', 0xa3: u'Đ', 0xa4: u'Þ',
+    0xa5: u'Æ', 0xa6: u'Œ', 0xa7: u'ʹ', 0xa8: u'·',
+    0xa9: u'♭', 0xaa: u'®', 0xab: u'±', 0xac: u'Ơ',
+    0xad: u'Ư', 0xae: u'ʼ', 0xb0: u'ʻ', 0xb1: u'ł',
+    0xb2: u'ø', 0xb3: u'đ', 0xb4: u'þ', 0xb5: u'æ',
+    0xb6: u'œ', 0xb7: u'ʺ', 0xb8: u'ı', 0xb9: u'£',
+    0xba: u'ð', 0xbc: u'ơ', 0xbd: u'ư', 0xc0: u'°',
+    0xc1: u'ℓ', 0xc2: u'℗', 0xc3: u'©', 0xc4: u'♯',
+    0xc5: u'¿', 0xc6: u'¡', 0xc7: u'ß', 0xc8: u'€',
+}
+
+# combining marks precede the character they modify in MARC-8
+EXTENDED_LATIN_COMBINING = {
+    0xe0: u'̉', 0xe1: u'̀', 0xe2: u'́', 0xe3: u'̂',
+    0xe4: u'̃', 0xe5: u'̄', 0xe6: u'̆', 0xe7: u'̇',
+    0xe8: u'̈', 0xe9: u'̌', 0xea: u'̊', 0xeb: u'︠',
+    0xec: u'︡', 0xed: u'̕', 0xee: u'̋', 0xef: u'̐',
+    0xf0: u'̧', 0xf1: u'̨', 0xf2: u'̣', 0xf3: u'̤',
+    0xf4: u'̥', 0xf5: u'̳', 0xf6: u'̲', 0xf7: u'̦',
+    0xf8: u'̜', 0xf9: u'̮', 0xfa: u'︢', 0xfb: u'︣',
+    0xfe: u'̓',
+}
+
+GREEK_SYMBOLS = {0x61: u'α', 0x62: u'β', 0x63: u'γ'}
+
+SUBSCRIPTS = {0x28: u'₍', 0x29: u'₎', 0x2b: u'₊', 0x2d: u'₋'}
+SUBSCRIPTS.update((0x30 + i, unichr(0x2080 + i)) for i in range(10))
+
+SUPERSCRIPTS = {0x28: u'⁽', 0x29: u'⁾', 0x2b: u'⁺', 0x2d: u'⁻',
+                0x30: u'⁰', 0x31: u'¹', 0x32: u'²', 0x33: u'³'}
+SUPERSCRIPTS.update((0x34 + i, unichr(0x2074 + i)) for i in range(6))
+
+BASIC_CYRILLIC = dict((c, unichr(c)) for c in range(0x20, 0x40))
+BASIC_CYRILLIC.update((0x40 + i, c) for i, c in
+                      enumerate(u'юабцдефгхийклмнопярстужвьызшэщчъ'))
+BASIC_CYRILLIC.update((0x60 + i, c) for i, c in
+                      enumerate(u'ЮАБЦДЕФГХИЙКЛМНОПЯРСТУЖВЬЫЗШЭЩЧ'))
+
+
+def _table(*charsets):
+    """256 entries table of (unicode, combining) or None if unmapped,
+    charsets given in G0 (0x20-0x7e) are also mapped in G1 (0xa0-0xfe)
+    and the other way round
+    """
+    table = [None] * 256
+    for charset, combining in charsets:
+        for code, char in charset.items():
+            table[code] = (char, combining)
+            if 0x20 < code < 0x7f and table[code + 0x80] is None:
+                table[code + 0x80] = (char, combining)
+            elif 0xa0 < code < 0xff and table[code - 0x80] is None:
+                table[code - 0x80] = (char, combining)
+    return table
+
+_LATIN = (EXTENDED_LATIN, False), (EXTENDED_LATIN_COMBINING, True)
+
+# final character of escape sequences -> table
+CHARSETS = {
+    0x42: _table((BASIC_LATIN, False)),                         # B
+    0x45: _table(*_LATIN),                                      # E
+    0x4e: _table((BASIC_CYRILLIC, False)),                      # N
+    0x67: _table((GREEK_SYMBOLS, False)),                       # g
+    0x62: _table((SUBSCRIPTS, False)),                          # b
+    0x70: _table((SUPERSCRIPTS, False)),                        # p
+    0x73: _table((BASIC_LATIN, False)),                         # s
+}
+
+# default working sets: ASCII as G0, ANSEL as G1
+_DEFAULT = CHARSETS[0x42][:0x80] + CHARSETS[0x45][0x80:]
+
+_cache = {}
+
+
+def _is_ascii(data):
+    try:
+        data.decode('ascii')
+    except UnicodeError:
+        return False
+    return b'\x1b' not in data
+
+
+def decode(data):
+    """Decode a MARC-8 string
+    :param data: encoded string
+    :type data: str
+    :return decoded string (NFC)
+    :rtype unicode
+    """
+    if not isinstance(data, bytes):
+        return data
+    decoded = _cache.get(data)
+    if decoded is None:
+        if _is_ascii(data):
+            decoded = data.decode('ascii')
+        else:
+            decoded = _decode(data)
+        if len(_cache) >= CACHE_SIZE:
+            _cache.clear()
+        _cache[data] = decoded
+    return decoded
+
+
+def _decode(data):
+    data = bytearray(data)
+    g0 = _DEFAULT[:0x80]
+    g1 = _DEFAULT[0x80:]
+    out = []
+    combining = []
+    i = 0
+    length = len(data)
+    while i < length:
+        code = data[i]
+        if code == ESC and i + 1 < length:
+            i, g0, g1 = _escape(data, i + 1, g0, g1)
+            continue
+        i += 1
+        if code <= 0x20:
+            if code == 0x20:
+                out.append(u' ')
+                if combining:
+                    out.extend(combining)
+                    combining = []
+            continue
+        if code < 0x80:
+            entry = g0[code]
+        else:
+            entry = g1[code - 0x80]
+        if entry is None:
+            if g0 is _UNSUPPORTED_MULTIBYTE and code >= 0x21:
+                # East Asian characters are three bytes long
+                i += 2
+            out.append(REPLACEMENT)
+        elif entry[1]:
+            combining.append(entry[0])
+        else:
+            out.append(entry[0])
+            if combining:
+                out.extend(combining)
+                combining = []
+    out.extend(combining)
+    return unicodedata.normalize('NFC', u''.join(out))
+
+_UNSUPPORTED = [None] * 0x80
+_UNSUPPORTED_MULTIBYTE = [None] * 0x80
+
+
+def _escape(data, i, g0, g1):
+    """Process an escape sequence starting after ESC at index i
+    :return index after the sequence, new G0 and G1
+    """
+    code = data[i]
+    if code in (0x67, 0x62, 0x70, 0x73):
+        # technique 2: greek symbols, subscripts, superscripts, ascii
+        return i + 1, CHARSETS[code][:0x80], g1
+    if code == 0x24:
+        # multibyte character set
+        i += 1
+        if i < len(data) and data[i] in (0x28, 0x29, 0x2c, 0x2d):
+            i += 1
+        return i + 1, _UNSUPPORTED_MULTIBYTE, g1
+    if code in (0x28, 0x2c, 0x29, 0x2d) and i + 1 < len(data):
+        final = data[i + 1]
+        table = CHARSETS.get(final)
+        if code in (0x28, 0x2c):
+            return i + 2, table[:0x80] if table else _UNSUPPORTED, g1
+        return i + 2, g0, table[0x80:] if table else _UNSUPPORTED
+    return i, g0, g1
@@ -0,0 +1,34 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class NegativeCache(object):
+    """Remembers for a short time lookups which gave nothing (unknown items,
+    searches without results), least recently used keys are dropped first
+    """
+
+    def __init__(self, timeout=30, max_size=10000):
+        """
+        :param timeout: time (seconds) a miss is remembered
+        :param max_size: maximum number of misses remembered
+        """
+        self.timeout = timeout
+        self.max_size = max_size
+        self._misses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            expires = self._misses.pop(key, None)
+            if expires is None or expires < time.time():
+                return False
+            self._misses[key] = expires
+            return True
+
+    def add(self, key):
+        with self._lock:
+            self._misses.pop(key, None)
+            self._misses[key] = time.time() + self.timeout
+            while len(self._misses) > self.max_size:
+                self._misses.popitem(last=False)
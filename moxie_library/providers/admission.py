@@ -0,0 +1,58 @@
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """The request has not been admitted (too many requests in flight or
+    waiting for too long)
+    """
+
+
+class AdmissionController(object):
+    """Bounds the number of concurrent requests to a backend, requests over
+    the limit wait in a first-in first-out queue of bounded size
+    """
+
+    def __init__(self, max_in_flight=20, max_queue=50, queue_timeout=1.0):
+        """
+        :param max_in_flight: maximum number of concurrent requests
+        :param max_queue: maximum number of requests waiting
+        :param queue_timeout: maximum time (seconds) spent waiting
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait for a slot, which must then be released
+        :raise AdmissionRejected: if the queue is full or the wait is too long
+        """
+        with self._lock:
+            if self.in_flight < self.max_in_flight and not self._queue:
+                self.in_flight += 1
+                return
+            if len(self._queue) >= self.max_queue:
+                raise AdmissionRejected("Queue full ({0} waiting)".format(len(self._queue)))
+            waiter = threading.Event()
+            self._queue.append(waiter)
+        # slots are handed over by release in order of arrival
+        waiter.wait(self.queue_timeout)
+        with self._lock:
+            if waiter.is_set():
+                return
+            self._queue.remove(waiter)
+        raise AdmissionRejected("Waited more than {0}s".format(self.queue_timeout))
+
+    def release(self):
+        with self._lock:
+            if self._queue:
+                # the slot goes to the first waiting request
+                self._queue.popleft().set()
+            else:
+                self.in_flight -= 1
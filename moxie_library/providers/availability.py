@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AvailabilityPoller(object):
+    """Keeps track of the most requested items and refreshes their
+    availability in the background, so that requests for these items do not
+    wait for the circulation system
+    """
+
+    def __init__(self, fetch, interval=60, hot_items=100, rate=2.0, max_age=None):
+        """
+        :param fetch: function taking a control number and returning the parsed
+                      availability state of this item
+        :param interval: time (seconds) between two refreshes of hot items
+        :param hot_items: maximum number of items refreshed
+        :param rate: maximum number of calls to fetch per second
+        :param max_age: time (seconds) after which a state is not used anymore
+                        (defaults to twice the interval)
+        """
+        self.fetch = fetch
+        self.interval = interval
+        self.hot_items = hot_items
+        self.rate = rate
+        self.max_age = max_age or interval * 2
+        self._hits = {}
+        self._states = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def hit(self, control_number):
+        """Count a request for an item, starts the poller if needed
+        """
+        with self._lock:
+            self._hits[control_number] = self._hits.get(control_number, 0) + 1
+            if len(self._hits) > self.hot_items * 10:
+                self._trim()
+            # threads do not survive a fork, start one in each worker
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                thread = threading.Thread(target=self.run)
+                thread.daemon = True
+                thread.start()
+
+    def get(self, control_number):
+        """Availability state of an item if it has been refreshed recently
+        :return state or None
+        """
+        with self._lock:
+            state = self._states.get(control_number)
+        if state and time.time() - state[0] <= self.max_age:
+            return state[1]
+        return None
+
+    def put(self, control_number, state):
+        with self._lock:
+            self._states[control_number] = (time.time(), state)
+
+    def hottest(self):
+        """Items to refresh, within the budget of requests per interval
+        """
+        budget = min(self.hot_items, int(self.rate * self.interval))
+        with self._lock:
+            return sorted(self._hits, key=self._hits.get, reverse=True)[:budget]
+
+    def run(self):
+        while True:
+            started = time.time()
+            try:
+                self.refresh()
+            except Exception:
+                logger.error("Unable to refresh availability of hot items", exc_info=True)
+            elapsed = time.time() - started
+            if elapsed < self.interval:
+                time.sleep(self.interval - elapsed)
+
+    def refresh(self):
+        hottest = self.hottest()
+        for control_number in hottest:
+            started = time.time()
+            try:
+                self.put(control_number, self.fetch(control_number))
+            except Exception:
+                logger.warning("Unable to refresh availability", exc_info=True,
+                               extra={'data': {'control_number': control_number}})
+            elapsed = time.time() - started
+            if elapsed < 1.0 / self.rate:
+                time.sleep(1.0 / self.rate - elapsed)
+        with self._lock:
+            # hits decay so that items which are not requested anymore leave the set
+            for control_number in list(self._hits):
+                self._hits[control_number] //= 2
+                if not self._hits[control_number]:
+                    del self._hits[control_number]
+            hot = set(hottest)
+            for control_number in list(self._states):
+                if control_number not in hot:
+                    del self._states[control_number]
+
+    def _trim(self):
+        """Keep the most requested items only, lock must be held
+        """
+        kept = sorted(self._hits, key=self._hits.get, reverse=True)[:self.hot_items * 5]
+        self._hits = dict((control_number, self._hits[control_number]) for control_number in kept)
@@ -0,0 +1,86 @@
+import logging
+import multiprocessing
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class DecodingPool(object):
+    """Decodes records in a pool of worker processes, so that parsing large
+    pages of results is not bound to a single core. Small batches are left to
+    the caller, sending them to another process would cost more than parsing.
+    """
+
+    def __init__(self, processes=None, threshold=50, chunk_size=25, timeout=10):
+        """
+        :param processes: number of worker processes (number of cores if None)
+        :param threshold: minimum number of records decoded in the pool
+        :param chunk_size: number of records sent at once to a worker
+        :param timeout: maximum time (seconds) to wait for workers
+        """
+        self.processes = processes
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # processes of the pool do not survive a fork, start a pool in each worker
+        with self._lock:
+            if self._pid != os.getpid() or self._pool is None:
+                self._pool = _create_pool(self.processes)
+                self._pid = os.getpid()
+            return self._pool
+
+    def start(self):
+        """Start the processes of the pool. Forking a process running threads
+        can leave a lock held in children, this should be called in each
+        worker before it starts threads (e.g. from a post-fork hook), the pool
+        is started on first use otherwise
+        """
+        self._get_pool()
+
+    def _discard(self, pool):
+        """Terminate a pool which did not answer in time, a new pool is
+        started on next use
+        """
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.terminate()
+
+    def map(self, function, records):
+        """Apply a function to chunks of records in the pool
+        :param function: module-level function taking a list of records
+                         and returning a list of decoded records
+        :param records: list of records (which can be pickled)
+        :return list of decoded records, or None if the batch is under the
+                threshold or the pool failed (records should then be decoded
+                by the caller)
+        """
+        if len(records) < self.threshold:
+            return None
+        chunks = [records[i:i + self.chunk_size] for i in range(0, len(records), self.chunk_size)]
+        pool = self._get_pool()
+        try:
+            decoded = pool.map_async(function, chunks).get(self.timeout)
+        except multiprocessing.TimeoutError:
+            logger.warning("Decoding pool did not answer in %ss, restarting it", self.timeout)
+            self._discard(pool)
+            return None
+        except Exception:
+            logger.warning("Unable to decode records in worker processes", exc_info=True)
+            return None
+        return [record for chunk in decoded for record in chunk]
+
+
+def _create_pool(processes):
+    # children are started by a server process where supported, rather than
+    # forked from a process running threads
+    get_context = getattr(multiprocessing, 'get_context', None)
+    if get_context is not None and 'forkserver' in multiprocessing.get_all_start_methods():
+        return get_context('forkserver').Pool(processes)
+    return multiprocessing.Pool(processes)
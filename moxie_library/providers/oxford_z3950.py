@@ -1,35 +1,111 @@
 import logging
 import datetime
+import hashlib
 import socket
+import threading
+import time
 from contextlib import contextmanager
-from collections import defaultdict
-
-import requests
-from requests import RequestException
-from lxml import etree
-from PyZ3950 import zoom
+from collections import defaultdict, namedtuple
 
 from moxie.core.exceptions import ServiceUnavailable
 from moxie_library.domain import LibrarySearchResult, LibrarySearchException, Library
+from moxie_library.providers.replicas import ReplicaSet
+from moxie_library.providers.shared import shared, config_key
+from moxie_library.providers.availability import AvailabilityPoller
+from moxie_library.providers.admission import AdmissionController, AdmissionRejected
+from moxie_library.providers.record_store import RecordStore
+from moxie_library.providers.decoding import DecodingPool
+from moxie_library.lazy import LazyModule
+from moxie_library import marc8, iso2709, slowlog
 
 SOCKET_TIMEOUT = 4
+ID_FIELD = frozenset(['id'])
+ALEPH_TIMEOUT = 2
 
 logger = logging.getLogger(__name__)
 
+_local = threading.local()
+
+
+class _TimeoutSocketModule(object):
+    """Stands for the socket module used by PyZ3950: sockets are created
+    with the timeout of the current thread instead of the process-wide
+    default timeout
+    """
+
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def socket(self, *args, **kwargs):
+        sock = self._module.socket(*args, **kwargs)
+        timeout = getattr(_local, 'timeout', None)
+        if timeout is not None:
+            sock.settimeout(timeout)
+        return sock
+
+
+def _install_timeout_socket(zoom):
+    if not isinstance(zoom.z3950.socket, _TimeoutSocketModule):
+        zoom.z3950.socket = _TimeoutSocketModule(socket)
+
+
+# PyZ3950 (ASN.1 set-up in particular), lxml and requests are slow to import,
+# they are only imported when first used
+zoom = LazyModule('PyZ3950.zoom', on_import=_install_timeout_socket)
+requests = LazyModule('requests')
+etree = LazyModule('lxml.etree')
+
 
 @contextmanager
-def handle_connection(seconds):
-    """Set timeout
+def socket_timeout(seconds):
+    """Set timeout of Z39.50 sockets created by the current thread
     """
-    original = socket.getdefaulttimeout()
-    socket.setdefaulttimeout(seconds)
+    original = getattr(_local, 'timeout', None)
+    _local.timeout = seconds
     try:
         yield
-    except:
-        logger.warning("Z3950 connection error", exc_info=True)
-        raise ServiceUnavailable()
     finally:
-        socket.setdefaulttimeout(original)
+        _local.timeout = original
+
+
+@contextmanager
+def handle_connection(seconds):
+    """Set timeout
+    """
+    with socket_timeout(seconds):
+        try:
+            yield
+        except (ServiceUnavailable, zoom.Bib1Err):
+            # errors in the query are handled by callers
+            raise
+        except:
+            logger.warning("Z3950 connection error", exc_info=True)
+            raise ServiceUnavailable()
+
+
+def aleph_session():
+    """HTTP session to Aleph, one per thread as sessions are not thread-safe
+    """
+    session = getattr(_local, 'aleph_session', None)
+    if session is None:
+        session = _local.aleph_session = requests.Session()
+    return session
+
+
+def circ_status_url(aleph_url, control_number):
+    return "{base}?op=circ-status&library=BIB01&sys_no={id}".format(base=aleph_url, id=control_number)
+
+
+def fetch_circ_status(aleph_url, control_number):
+    """Get availability of the copies of an item from Aleph
+    :return list of (location, due date) of copies
+    """
+    response = aleph_session().get(circ_status_url(aleph_url, control_number), timeout=ALEPH_TIMEOUT)
+    response.raise_for_status()
+    return OXMARCSearchResult.parse_circ_status(response.content)
 
 
 class Z3950(object):
@@ -39,18 +115,52 @@ class Z3950(object):
         A thing that pretends to be a list for lazy parsing of search results
         """
 
-        def __init__(self, results, wrapper, results_encoding, availability=False, aleph_url=""):
+        def __init__(self, results, wrapper, results_encoding, availability=False, aleph_url="", fields=None,
+                     poller=None, decoder=None, timeout=SOCKET_TIMEOUT):
             self.results = results
             self._wrapper = wrapper
             self._results_encoding = results_encoding
             self._availability = availability
             self._aleph_url = aleph_url
+            self._fields = fields
+            self._poller = poller
+            self._decoder = decoder
+            self._timeout = timeout
+
+        def _wrap(self, result):
+            return self._wrapper(result, results_encoding=self._results_encoding,
+                availability=self._availability, aleph_url=self._aleph_url, fields=self._fields,
+                poller=self._poller)
+
+        def _wrap_records(self, records):
+            """
+            Wrap a batch of records, large batches are parsed in the decoding
+            pool (availability is still annotated in this process)
+            """
+            parsed = None
+            if self._decoder is not None and len(records) >= self._decoder.threshold:
+                parsed = self._decoder.map(_parse_records,
+                                           [(raw_record(r), self._results_encoding) for r in records])
+            return (self._wrap(r) for r in (records if parsed is None else parsed))
 
         def __iter__(self):
             for result in self.results:
-                yield self._wrapper(result,
-                    results_encoding=self._results_encoding,
-                    availability=self._availability, aleph_url=self._aleph_url)
+                yield self._wrap(result)
+
+        def iterchunks(self, chunk_size, admitted=None):
+            """
+            Iterate over the whole result set, fetching raw records from the
+            server chunk_size at a time and parsing each one only when it is
+            consumed
+            :param admitted: context manager holding a slot of the limit of
+                             concurrent searches while fetching a chunk
+            """
+            for offset in xrange(0, len(self.results), chunk_size):
+                with admitted() if admitted else _no_admission():
+                    with handle_connection(self._timeout):
+                        records = self.results.__getslice__(offset, offset + chunk_size)
+                for result in self._wrap_records(records):
+                    yield result
 
         def __len__(self):
             return len(self.results)
@@ -59,18 +169,21 @@ class Z3950(object):
             if isinstance(key, slice):
                 if key.step:
                     raise NotImplementedError("Stepping not supported")
-                return (self._wrapper(r, results_encoding=self._results_encoding, availability=self._availability, aleph_url=self._aleph_url)\
-                    for r in self.results.__getslice__(key.start, key.stop))
+                return self._wrap_records(self.results.__getslice__(key.start, key.stop))
             else:
-                return self._wrapper(self.results[key],
-                    results_encoding=self._results_encoding, availability=self._availability, aleph_url=self._aleph_url)
+                return self._wrap(self.results[key])
 
     def __init__(self, host, database, port=210, syntax='USMARC',
                  charset='UTF-8', control_number_key='12',
-                 results_encoding='marc8', aleph_url=''):
+                 results_encoding='marc8', aleph_url='', hedge_percentile=95,
+                 max_failures=3, ejection_time=30, availability_poller=None,
+                 brief_element_set=None, brief_fields=('title', 'author', 'publisher', 'edition', 'isbns', 'issns'),
+                 admission=None, record_store=None, decoding_pool=None, timeout=SOCKET_TIMEOUT):
         """
-        @param host: The hostname of the Z39.50 instance to connect to
-        @type host: str
+        @param host: The hostname of the Z39.50 instance to connect to, or a
+                     list of hostnames (optionally "host:port") of equivalent
+                     replicas
+        @type host: str or list
         @param database: The database name
         @type database: str
         @param port: An optional port for the Z39.50 database
@@ -84,35 +197,183 @@ class Z3950(object):
                                    querying
         @param results_encoding: The encoding (either unicode or marc8) of data
                                  this server returns
+        @param hedge_percentile: Percentile of the latency of a replica after
+                                 which the search is duplicated to another
+                                 replica
+        @param max_failures: Number of consecutive failures after which a
+                             replica is ejected
+        @param ejection_time: Time (seconds) before an ejected replica is tried
+                              again
+        @param availability_poller: Options of the background refresh of the
+                                    availability of the most requested items
+                                    (interval, hot_items, rate, max_age), no
+                                    background refresh if None
+        @type availability_poller: dict
+        @param brief_element_set: Name of the element set giving brief records
+                                  (e.g. "B"), used for searches which only
+                                  need brief fields. Full records are always
+                                  fetched if None
+        @type brief_element_set: str
+        @param brief_fields: Fields available in brief records
+        @type brief_fields: list
+        @param admission: Options of the limit of concurrent searches
+                          (max_in_flight, max_queue, queue_timeout), searches
+                          over the limit fail fast. No limit if None
+        @type admission: dict
+        @param record_store: Options of the store of parsed records shared by
+                             workers of the host (path, slots, slot_size,
+                             ways, compression, max_age), checked before
+                             searching by control number. No store if None
+        @type record_store: dict
+        @param decoding_pool: Options of the pool of processes decoding large
+                              pages of results (processes, threshold,
+                              chunk_size, timeout), records are decoded in
+                              the request thread if None
+        @type decoding_pool: dict
+        @param timeout: Timeout (seconds) of connections to the Z39.50 server
+        @type timeout: float
         """
 
         # Could create a persistent connection here
-        self._host = host
+        if isinstance(host, basestring):
+            host = [host]
+        endpoints = []
+        for endpoint in host:
+            if ':' in endpoint:
+                endpoint, endpoint_port = endpoint.rsplit(':', 1)
+                endpoints.append((endpoint, int(endpoint_port)))
+            else:
+                endpoints.append((endpoint, port))
+        self._endpoints = endpoints
+        self._hedge_percentile = hedge_percentile
+        self._max_failures = max_failures
+        self._ejection_time = ejection_time
+        self._replicas = None
         self._database = database
-        self._port = port
         self._syntax = syntax
         self._wrapper = OXMARCSearchResult
         self._control_number_key = control_number_key
         self._charset = charset
         self._results_encoding = results_encoding
         self._aleph_url = aleph_url
+        self._brief_element_set = brief_element_set
+        self._brief_fields = frozenset(brief_fields)
+        self._timeout = timeout
+        if admission is not None:
+            # the limit applies to every request of the process
+            self._admission = shared(('admission', config_key(endpoints), database, config_key(admission)),
+                                     lambda: AdmissionController(**admission))
+        else:
+            self._admission = None
+        if decoding_pool is not None:
+            # one pool per process, shared by every request
+            self._decoder = shared(('decoding_pool', config_key(decoding_pool)),
+                                   lambda: DecodingPool(**decoding_pool))
+        else:
+            self._decoder = None
+        if record_store is not None:
+            # one mapping per process, shared by every request
+            self._record_store = shared(('record_store', config_key(record_store)),
+                                        lambda: RecordStore(**record_store))
+        else:
+            self._record_store = None
+        if availability_poller is not None:
+            # one poller (and thread) per process, hits are counted across requests
+            self._poller = shared(('poller', aleph_url, config_key(availability_poller)),
+                                  lambda: AvailabilityPoller(
+                                      lambda control_number: fetch_circ_status(aleph_url, control_number),
+                                      **availability_poller))
+        else:
+            self._poller = None
 
-    def _make_connection(self):
+    def _make_connection(self, host, port, element_set=None):
         """
         Returns a connection to the Z39.50 server
+        :param element_set: name of the element set of records to fetch
+                            (full records if None)
         """
-        # Create connection to database
-        connection = zoom.Connection(
-            self._host,
-            self._port,
-            charset = self._charset,
-        )
+        # Create connection to database, timeout is set on the socket of this
+        # connection only as the connection may be made in another thread
+        with socket_timeout(self._timeout):
+            connection = zoom.Connection(
+                host,
+                port,
+                charset = self._charset,
+            )
         connection.databaseName = self._database
         connection.preferredRecordSyntax = self._syntax
+        if element_set:
+            connection.elementSetName = element_set
 
         return connection
 
-    def library_search(self, query, start, count, availability=False):
+    def _element_set(self, fields):
+        """
+        Brief records are fetched if only fields they contain are required,
+        the ID (001) is in every record
+        :return name of the element set or None for full records
+        """
+        if self._brief_element_set and fields is not None and fields - ID_FIELD <= self._brief_fields:
+            return self._brief_element_set
+        return None
+
+    def _search(self, z3950_query, element_set=None):
+        """
+        Performs the search on the fastest replica (hedged to another
+        replica if it is too slow to answer)
+        :param element_set: name of the element set of records to fetch
+        :return connection, zoom result set
+        """
+        def search(replica):
+            connection = self._make_connection(replica.host, replica.port, element_set)
+            try:
+                return connection, connection.search(z3950_query)
+            except:
+                self._close(connection)
+                raise
+        return self._replica_set().call(search, discard=lambda outcome: self._close(outcome[0]))
+
+    def _acquire_slot(self):
+        """
+        Wait for a slot of the limit of concurrent searches, if any. The slot
+        is held while searching and fetching records
+        :raise ServiceUnavailable: if the search is not admitted
+        """
+        if self._admission is None:
+            return
+        try:
+            self._admission.acquire()
+        except AdmissionRejected as e:
+            logger.info("Z3950 search rejected: %s", e)
+            raise ServiceUnavailable()
+
+    def _release_slot(self):
+        if self._admission is not None:
+            self._admission.release()
+
+    @contextmanager
+    def _admitted(self):
+        self._acquire_slot()
+        try:
+            yield
+        finally:
+            self._release_slot()
+
+    def _replica_set(self):
+        """
+        Replicas are set up on first search as errors from PyZ3950 are needed,
+        they are shared by the process so that latencies and failures are
+        kept across requests
+        """
+        if self._replicas is None:
+            key = ('replicas', config_key(self._endpoints), self._hedge_percentile, self._max_failures,
+                   self._ejection_time)
+            self._replicas = shared(key, lambda: ReplicaSet(
+                self._endpoints, hedge_percentile=self._hedge_percentile, max_failures=self._max_failures,
+                ejection_time=self._ejection_time, ignore=(zoom.Bib1Err,)))
+        return self._replicas
+
+    def library_search(self, query, start, count, availability=False, count_only=False, fields=None):
         """
         Search the library with a search query
         :param query: The query to be performed
@@ -123,52 +384,126 @@ class Z3950(object):
         :type count: int
         :param availability: annotate with availability information
         :type availability: boolean
+        :param count_only: only get the total size of results, no record is
+                           fetched or parsed
+        :type count_only: boolean
+        :param fields: fields required, holdings are only parsed (and
+                       annotated) if requested, all fields if None
+        :type fields: frozenset or None
         :return total size of results, set of results
         """
+        z3950_query = self._make_query(query)
 
-        # Convert Query object into a Z39.50 query - we escape for the query by
-        # removing quotation marks
-        z3950_query = []
-        if query.author:
-            z3950_query.append('(au="%s")' % query.author.replace('"', ''))
-        if query.title:
-            z3950_query.append('(ti="%s")' % query.title.replace('"', ''))
-        if query.isbn:
-            z3950_query.append('(isbn="%s")' % query.isbn.replace('"', ''))
-        if query.issn:
-            z3950_query.append('((1,8)="%s")' % query.issn.replace('"', ''))
-
-        z3950_query = zoom.Query('CCL', 'and'.join(z3950_query))
+        # the slot is held until the page of records has been fetched
+        with self._admitted():
+            connection = None
+            try:
+                with handle_connection(self._timeout):
+                    connection, resultset = self._search(z3950_query, self._element_set(fields))
+                    results = self.Results(resultset,
+                        self._wrapper, self._results_encoding, availability=availability, aleph_url=self._aleph_url,
+                        fields=fields, poller=self._poller, decoder=self._decoder,
+                        timeout=self._timeout)
+            except zoom.Bib1Err as e:
+                # 31 = Resources exhausted - no results available
+                if e.condition in (31,):
+                    return 0, []
+                else:
+                    raise LibrarySearchException(e.message)
+            except zoom.ZoomError as e:
+                logger.warning("Z3950 provider exception", exc_info=True)
+                raise ServiceUnavailable()
+            else:
+                if count_only:
+                    return len(results), []
+                return len(results), results[start:(start+count)]
+            finally:
+                try:
+                    connection.close()
+                except:
+                    pass
+
+    def library_export(self, query, chunk_size=100, availability=False, fields=None):
+        """
+        Search the library once and stream every result of the search
+        :param query: The query to be performed
+        :type query: :py:class:`LibrarySearchQuery`
+        :param chunk_size: number of raw records fetched from the server at once
+        :type chunk_size: int
+        :param availability: annotate with availability information
+        :type availability: boolean
+        :param fields: fields required, all fields if None
+        :type fields: frozenset or None
+        :return total size of results, generator of results
+        """
+        z3950_query = self._make_query(query)
 
+        connection = None
         try:
-            with handle_connection(SOCKET_TIMEOUT):
-                connection = self._make_connection()
-                results = self.Results(connection.search(z3950_query),
-                    self._wrapper, self._results_encoding, availability=availability, aleph_url=self._aleph_url)
+            with self._admitted():
+                with handle_connection(self._timeout):
+                    connection, resultset = self._search(z3950_query, self._element_set(fields))
+                    results = self.Results(resultset,
+                        self._wrapper, self._results_encoding, availability=availability, aleph_url=self._aleph_url,
+                        fields=fields, poller=self._poller, decoder=self._decoder,
+                        timeout=self._timeout)
         except zoom.Bib1Err as e:
+            self._close(connection)
             # 31 = Resources exhausted - no results available
             if e.condition in (31,):
-                return []
+                return 0, iter([])
             else:
                 raise LibrarySearchException(e.message)
         except zoom.ZoomError as e:
+            self._close(connection)
             logger.warning("Z3950 provider exception", exc_info=True)
             raise ServiceUnavailable()
-        else:
-            return len(results), results[start:(start+count)]
-        finally:
-            try:
-                connection.close()
-            except:
-                pass
+        except:
+            self._close(connection)
+            raise
+
+        # connection is kept open until the last chunk has been fetched, a slot
+        # is only held while fetching a chunk (clients may read slowly)
+        return len(results), _Export(results.iterchunks(chunk_size, self._admitted),
+                                     lambda: self._close(connection))
+
+    def _make_query(self, query):
+        """
+        Convert Query object into a Z39.50 query - we escape for the query by
+        removing quotation marks
+        :param query: The query to be converted
+        :type query: :py:class:`LibrarySearchQuery`
+        :return zoom query
+        """
+        z3950_query = []
+        if query.author:
+            z3950_query.append('(au="%s")' % query.author.replace('"', ''))
+        if query.title:
+            z3950_query.append('(ti="%s")' % query.title.replace('"', ''))
+        if query.isbns:
+            # records hold either form, both are searched for at once
+            z3950_query.append('(%s)' % ' or '.join('isbn="%s"' % isbn for isbn in query.isbns))
+        if query.issn:
+            z3950_query.append('((1,8)="%s")' % query.issn.replace('"', ''))
+
+        return zoom.Query('CCL', 'and'.join(z3950_query))
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except:
+            pass
 
-    def control_number_search(self, control_number, availability=True):
+    def control_number_search(self, control_number, availability=True, fields=None):
         """
         Search the library with a unique ID of a resource
         :param control_number: The unique ID of the item to be looked up
         :type control_number: str
         :param availability: annotate with availability information
         :type availability: boolean
+        :param fields: fields required, all fields if None
+        :type fields: frozenset or None
         :return The item with this control ID, or None if none can be found
         :rtype LibrarySearchResult
         """
@@ -176,27 +511,76 @@ class Z3950(object):
         # Escape input
         control_number = control_number.replace('"', '')
 
+        if self._record_store:
+            record = self._record_store.get(control_number)
+            if record is not None:
+                return self._wrapper(ParsedRecord(*record), results_encoding=self._results_encoding,
+                    availability=availability, aleph_url=self._aleph_url, fields=fields, poller=self._poller)
+
         z3950_query = zoom.Query(
             'CCL', '(1,%s)="%s"' % (self._control_number_key, control_number))
 
-        try:
-            with handle_connection(SOCKET_TIMEOUT):
-                connection = self._make_connection()
-                results = self.Results(connection.search(z3950_query), self._wrapper,
-                    self._results_encoding, availability=availability, aleph_url=self._aleph_url)
-        except zoom.ZoomError as e:
-            logger.warning("Z3950 provider exception", exc_info=True)
-            raise ServiceUnavailable()
-        else:
-            if len(results) > 0:
-                return results[0]
-            else:
-                return None
-        finally:
+        with self._admitted():
+            connection = None
             try:
-                connection.close()
-            except:
-                pass
+                with handle_connection(self._timeout):
+                    connection, resultset = self._search(z3950_query)
+                    results = self.Results(resultset, self._wrapper,
+                        self._results_encoding, availability=availability, aleph_url=self._aleph_url,
+                        fields=fields, poller=self._poller)
+            except zoom.ZoomError as e:
+                logger.warning("Z3950 provider exception", exc_info=True)
+                raise ServiceUnavailable()
+            else:
+                if len(results) > 0:
+                    result = results[0]
+                    if self._record_store:
+                        self._record_store.put(control_number,
+                                               (result.control_number, result.raw, result.metadata))
+                    return result
+                else:
+                    return None
+            finally:
+                try:
+                    connection.close()
+                except:
+                    pass
+
+
+@contextmanager
+def _no_admission():
+    yield
+
+
+class _Export(object):
+    """
+    Iterator over the results of an export, release is called once when it is
+    exhausted, closed or garbage collected (e.g. the client went away before
+    the first result)
+    """
+
+    def __init__(self, results, release):
+        self._results = results
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            return next(self._results)
+        except:
+            self.close()
+            raise
+    __next__ = next
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def __del__(self):
+        self.close()
 
 
 class SearchResult(LibrarySearchResult):
@@ -216,6 +600,11 @@ class SearchResult(LibrarySearchResult):
         }
 
 
+# Record parsed from its ISO 2709 form (or text rendering), metadata being a
+# dict of tag -> list of fields, each field a dict of subfield code -> list of contents
+ParsedRecord = namedtuple('ParsedRecord', 'control_number raw metadata')
+
+
 class USMARCSearchResult(SearchResult):
     USM_CONTROL_NUMBER = 1
     USM_ISBN = 20
@@ -227,41 +616,55 @@ class USMARCSearchResult(SearchResult):
     USM_PHYSICAL_DESCRIPTION = 300
     USM_LOCATION = 852
 
-    def __init__(self, result, results_encoding):
-        self.str = str(result)
+    def __init__(self, result, results_encoding, fields=None):
+        """
+        :param result: record from PyZ3950, or record already parsed
+        :type result: zoom record or :py:class:`ParsedRecord`
+        :param results_encoding: encoding (marc8 or unicode) of records
+        :param fields: fields required, holdings are not built if not required
+        """
+        if not isinstance(result, ParsedRecord):
+            result = self.parse_record(result, results_encoding)
+        self.control_number, self.raw, metadata = result
         self.metadata = {self.USM_LOCATION: []}
+        self.metadata.update(metadata)
 
-        items = self.str.split('\n')[1:]
-        for item in items:
-            heading, data = item.split(' ', 1)
-            heading = int(heading)
-            if heading == self.USM_CONTROL_NUMBER:
-                self.control_number = data
-
-            # We'll use a slice as data may not contain that many characters.
-            # LCN 12110145 is an example where this would otherwise fail.
-            if data[2:3] != '$':
-                continue
-
-            subfields = data[3:].split(' $')
-            subfields = [(s[0], s[1:]) for s in subfields]
+        self.libraries = defaultdict(list)
 
-            if not heading in self.metadata:
-                self.metadata[heading] = []
+        if fields is not None and 'holdings' not in fields:
+            return
 
-            m = {}
-            for subfield_id, content in subfields:
-                if not subfield_id in m:
-                    m[subfield_id] = []
-                m[subfield_id].append(content)
-            self.metadata[heading].append(m)
+        self._build_libraries()
 
+    @classmethod
+    def parse_record(cls, result, results_encoding):
+        """Parse a record from PyZ3950
+        :rtype :py:class:`ParsedRecord`
+        """
         if results_encoding == 'marc8':
-            #self.metadata = marc_to_unicode(self.metadata)
-            pass
-
-        self.libraries = defaultdict(list)
-
+            decode = marc8.decode
+        else:
+            decode = None
+
+        # Records are parsed from their ISO 2709 form when available, rather
+        # than from the text rendering built by PyZ3950
+        data = getattr(result, 'data', None)
+        if isinstance(data, bytes) and iso2709.is_record(data):
+            if data[9:10] == b'a':
+                # leader/09: the record is in UCS/Unicode, not in MARC-8
+                decode = None
+            try:
+                control_number, metadata = iso2709.parse(data, decode)
+                return ParsedRecord(control_number, data, metadata)
+            except iso2709.ISO2709Error:
+                logger.warning("Unable to parse ISO 2709 record", exc_info=True)
+        raw = str(result)
+        control_number, metadata = cls.parse_text(raw, decode)
+        return ParsedRecord(control_number, raw, metadata)
+
+    def _build_libraries(self):
+        """Group holdings (852) by library
+        """
         for datum in self.metadata[self.USM_LOCATION]:
             library = Library(datum['b'] + datum.get('c', []))
 
@@ -284,6 +687,56 @@ class USMARCSearchResult(SearchResult):
                 'materials_specified': materials_specified,
                 })
 
+    def digest(self):
+        """Digest of the record and of the availability of its holdings
+        :rtype str
+        """
+        digest = hashlib.sha1(self.raw)
+        for library in sorted(self.libraries, key=lambda l: l.location):
+            for book in self.libraries[library]:
+                digest.update(repr((library.location, book.get('availability'),
+                                    book.get('availability_display'))))
+        return digest.hexdigest()
+
+    @classmethod
+    def parse_text(cls, text, decode=None):
+        """Parse the line-oriented text rendering of a record
+        :param text: text rendering of the record
+        :param decode: function to decode the content of subfields
+        :return control number, dict of tag -> list of fields, each field being a
+                dict of subfield code -> list of contents
+        """
+        control_number = None
+        metadata = {}
+
+        items = text.split('\n')[1:]
+        for item in items:
+            heading, data = item.split(' ', 1)
+            heading = int(heading)
+            if heading == cls.USM_CONTROL_NUMBER:
+                control_number = data
+
+            # We'll use a slice as data may not contain that many characters.
+            # LCN 12110145 is an example where this would otherwise fail.
+            if data[2:3] != '$':
+                continue
+
+            subfields = data[3:].split(' $')
+            subfields = [(s[0], s[1:]) for s in subfields]
+
+            if not heading in metadata:
+                metadata[heading] = []
+
+            m = {}
+            for subfield_id, content in subfields:
+                if not subfield_id in m:
+                    m[subfield_id] = []
+                if decode:
+                    content = decode(content)
+                m[subfield_id].append(content)
+            metadata[heading].append(m)
+        return control_number, metadata
+
     def _metadata_property(heading, sep=' '):
         def f(self):
             if not heading in self.metadata:
@@ -293,6 +746,16 @@ class USMARCSearchResult(SearchResult):
         return property(f)
 
     title = _metadata_property(USM_TITLE_STATEMENT)
+
+    @property
+    def short_title(self):
+        """Title proper and remainder of title, without statement of responsibility
+        """
+        if not self.USM_TITLE_STATEMENT in self.metadata:
+            return None
+        field = self.metadata[self.USM_TITLE_STATEMENT][0]
+        return ' '.join(' '.join(field[k]) for k in ('a', 'b') if k in field) or None
+
     publisher = _metadata_property(USM_PUBLICATION)
     author = _metadata_property(USM_AUTHOR)
     description = _metadata_property(USM_PHYSICAL_DESCRIPTION)
@@ -315,6 +778,37 @@ class USMARCSearchResult(SearchResult):
             return []
 
 
+class RawRecord(object):
+    """Stands for a record of PyZ3950 built from its raw form (records
+    decoded in the pool or replayed from the slow query log)
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return self.data
+
+
+def raw_record(record):
+    """ISO 2709 form of a record from PyZ3950 when available, its text
+    rendering otherwise
+    """
+    data = getattr(record, 'data', None)
+    if isinstance(data, bytes) and iso2709.is_record(data):
+        return data
+    return str(record)
+
+
+def _parse_records(records):
+    """Parse records in a process of the decoding pool
+    :param records: list of (raw record, results encoding)
+    :return list of :py:class:`ParsedRecord`
+    """
+    return [USMARCSearchResult.parse_record(RawRecord(raw), results_encoding)
+            for raw, results_encoding in records]
+
+
 class OXMARCSearchResult(USMARCSearchResult):
     """Largely does the same as USMARCSearchResults but if availability=True then queries
     Aleph to get holdings data.
@@ -322,10 +816,13 @@ class OXMARCSearchResult(USMARCSearchResult):
     def __init__(self, *args, **kwargs):
         availability = kwargs.pop('availability')
         self.aleph_url = kwargs.pop('aleph_url')
+        # not kept on the result as results are pickled when cached
+        poller = kwargs.pop('poller', None)
         super(OXMARCSearchResult, self).__init__(*args, **kwargs)
+        fields = kwargs.get('fields')
         # Attach availability information to self.metadata
-        if availability:
-            self.annotate_availability()
+        if availability and (fields is None or 'holdings' in fields):
+            self.annotate_availability(poller)
             try:
                 for library in self.libraries:
                     library.availability = max(l['availability'] for l in self.libraries[library])
@@ -342,42 +839,75 @@ class OXMARCSearchResult(USMARCSearchResult):
             shelfmark = shelfmark[:shelfmark.index('(copy')]
         return shelfmark.strip()
 
-    def annotate_availability(self):
+    def annotate_availability(self, poller=None):
         """Annotate search result with availability information from Aleph.
+        :param poller: availability of hot items is taken from this poller
+                       rather than from Aleph
+        :type poller: :py:class:`AvailabilityPoller`
         """
+        if poller:
+            poller.hit(self.control_number)
+            items = poller.get(self.control_number)
+            if items is not None:
+                try:
+                    self.apply_availability(items)
+                except Exception:
+                    logger.error('Unable to apply availability information', exc_info=True,
+                                 extra={'data': {'control_number': self.control_number}})
+                return
+        started = time.time()
         try:
-            response = requests.get("{base}?op=circ-status&library=BIB01&sys_no={id}".format(base=self.aleph_url, id=self.control_number),
-                                    timeout=2)
+            response = aleph_session().get(circ_status_url(self.aleph_url, self.control_number),
+                                           timeout=ALEPH_TIMEOUT)
             response.raise_for_status()
-        except RequestException as re:
+        except requests.RequestException as re:
             logger.error("Couldn't reach {url}".format(url=self.aleph_url,),
                          exc_info=True, extra={'data': {'control_number': self.control_number}})
         else:
+            slowlog.record_availability(self.control_number, response.content, time.time() - started)
             try:
-                self.parse_availability(response.content)
+                items = self.parse_circ_status(response.content)
+                self.apply_availability(items)
             except Exception as e:
                 logger.error('Unable to parse availability information', exc_info=True,
                              extra={'data': {'control_number': self.control_number}})
+            else:
+                if poller:
+                    poller.put(self.control_number, items)
 
     def parse_availability(self, xml):
+        """Annotate search result with availability information
+        :param xml: string containing availability information as XML
+        """
+        self.apply_availability(self.parse_circ_status(xml))
+
+    @staticmethod
+    def parse_circ_status(xml):
+        """Parse availability information from Aleph
+        :param xml: string containing availability information as XML
+        :return list of (location, due date) of copies
+        """
+        et = etree.fromstring(xml, parser=etree.XMLParser(ns_clean=True, recover=True))
+        return [(item.find('location').text, item.find('due-date').text)
+                for item in et.xpath('/circ-status/item-data')]
+
+    def apply_availability(self, items):
         """Interesting for loop here, uses the for else.
         We go through all books in the libraries data (should only be 1 book per lib)
         Try to match the shelfmark from Z39.50 with Aleph and adds the availability info
-        :param xml: string containing availability information as XML
+        :param items: list of (location, due date) of copies from Aleph
         """
-        et = etree.fromstring(xml, parser=etree.XMLParser(ns_clean=True, recover=True))
-        items = et.xpath('/circ-status/item-data')
         found = set()
         for library, books in self.libraries.items():
             for book in books:
                 if book['shelfmark']:
                     location = self.sanitize_shelfmark(book['shelfmark'])
-                    for item in items:
-                        if item in found:
+                    for index, (item_location, avail) in enumerate(items):
+                        if index in found:
                             continue
-                        item_location = item.find('location').text
+                        # Aleph can give an empty due date
+                        avail = avail or ''
                         if item_location and item_location.startswith(location):
-                            avail = item.find('due-date').text
                             try:
                                 due_date = datetime.strptime(avail, '%d/%m/%y')
                                 book['due'] = due_date
@@ -386,13 +916,13 @@ class OXMARCSearchResult(USMARCSearchResult):
                             except:
                                 availability = LibrarySearchResult.GENERIC_AVAILABILITIES.get(self.AVAILABILITIES.get(avail),
                                                                                               self.AVAILABILITIES.get(LibrarySearchResult.AVAIL_UNAVAILABLE))
-                            if avail[-1] == '*':
+                            if avail.endswith('*'):
                                 book['availability_display'] = "Closed Stack / Request via SOLO"
                                 book['availability'] = LibrarySearchResult.GENERIC_AVAILABILITIES.get(LibrarySearchResult.AVAIL_STACK)
                             else:
                                 book['availability_display'] = avail
                                 book['availability'] = availability
-                            found.add(item)
+                            found.add(index)
                             break
                     else:  # Doesn't run if we break, only when we run out of items
                         logger.info("Couldn't find match for location - %s" % location)
\ No newline at end of file
@@ -0,0 +1,176 @@
+import fcntl
+import logging
+import marshal
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# beginning of the file, changed when the layout of slots changes
+MAGIC = b'MXRS0002'
+
+# sequence number (odd while the slot is written), length of the payload,
+# time of last use, time of writing, length of the key
+HEADER = struct.Struct('<IIddH')
+
+# number of attempts at reading a slot which is being written
+READ_ATTEMPTS = 3
+
+
+class RecordStore(object):
+    """Store of parsed records shared by the workers of a host through a
+    memory-mapped file, keyed by control number.
+
+    The file is divided in sets of a few slots of fixed size, a record goes to
+    the set given by the hash of its key and replaces the least recently used
+    record of that set. Records older than max_age are not used, so that they
+    are read again from the catalogue. Reads do not take any lock: a slot carries a sequence
+    number which is odd while it is written, a read is retried if the sequence
+    number changed while reading. Writes are serialised with a lock on the file.
+    """
+
+    def __init__(self, path, slots=4096, slot_size=8192, ways=4, compression=1, max_age=60):
+        """
+        :param path: file shared by workers (e.g. in /dev/shm)
+        :param slots: number of records kept
+        :param slot_size: size (bytes) of a slot, larger records are not stored
+        :param ways: number of slots of a set
+        :param compression: zlib level of records
+        :param max_age: time (seconds) after which a record is not used anymore
+        """
+        self.path = path
+        self.slot_size = slot_size
+        self.ways = ways
+        self.sets = max(1, slots // ways)
+        self.compression = compression
+        self.max_age = max_age
+        self.size = len(MAGIC) + self.sets * ways * slot_size
+        self._mmap = None
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        """Map the file, once per process as locks on the file are not
+        shared by forked workers
+        """
+        if self._pid == os.getpid():
+            return self._mmap
+        with self._lock:
+            if self._pid != os.getpid():
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    if os.fstat(fd).st_size != self.size or os.read(fd, len(MAGIC)) != MAGIC:
+                        # new file, different geometry or layout, start empty
+                        os.ftruncate(fd, 0)
+                        os.ftruncate(fd, self.size)
+                        os.lseek(fd, 0, os.SEEK_SET)
+                        os.write(fd, MAGIC)
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                self._mmap = mmap.mmap(fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+                self._fd = fd
+                self._pid = os.getpid()
+        return self._mmap
+
+    def _offsets(self, key):
+        first = (zlib.crc32(key) & 0xffffffff) % self.sets * self.ways
+        return [len(MAGIC) + (first + way) * self.slot_size for way in range(self.ways)]
+
+    def get(self, key):
+        """Record stored for a key
+        :param key: control number
+        :type key: str
+        :return record as stored or None (also if older than max_age)
+        """
+        key = _encode_key(key)
+        try:
+            mm = self._open()
+        except (IOError, OSError, mmap.error):
+            logger.warning("Unable to open record store", exc_info=True)
+            return None
+        for offset in self._offsets(key):
+            for attempt in range(READ_ATTEMPTS):
+                seq, length, used, written, key_length = HEADER.unpack_from(mm, offset)
+                if seq & 1:
+                    continue
+                if not length or key_length != len(key):
+                    break
+                start = offset + HEADER.size
+                stored_key = mm[start:start + key_length]
+                payload = mm[start + key_length:start + key_length + length]
+                if HEADER.unpack_from(mm, offset)[0] != seq:
+                    continue
+                if stored_key != key or time.time() - written > self.max_age:
+                    break
+                # approximate, concurrent readers may overwrite each other
+                struct.pack_into('<d', mm, offset + 8, time.time())
+                try:
+                    return marshal.loads(zlib.decompress(payload))
+                except (ValueError, EOFError, TypeError, zlib.error):
+                    logger.warning("Invalid record in record store", exc_info=True)
+                    return None
+        return None
+
+    def put(self, key, record):
+        """Store a record, replacing the least recently used record of its set
+        :param key: control number
+        :type key: str
+        :param record: record made of types supported by marshal
+        """
+        key = _encode_key(key)
+        try:
+            payload = zlib.compress(marshal.dumps(record), self.compression)
+        except ValueError:
+            logger.warning("Unable to encode record", exc_info=True)
+            return
+        if HEADER.size + len(key) + len(payload) > self.slot_size:
+            return
+        try:
+            mm = self._open()
+        except (IOError, OSError, mmap.error):
+            logger.warning("Unable to open record store", exc_info=True)
+            return
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                offset = self._victim(mm, key)
+                seq = HEADER.unpack_from(mm, offset)[0]
+                struct.pack_into('<I', mm, offset, (seq + 1) & 0xffffffff)
+                start = offset + HEADER.size
+                mm[start:start + len(key) + len(payload)] = key + payload
+                now = time.time()
+                HEADER.pack_into(mm, offset, (seq + 2) & 0xffffffff, len(payload), now, now, len(key))
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _victim(self, mm, key):
+        """Slot of the key if already stored, otherwise an empty slot or the
+        least recently used slot of its set, file lock must be held
+        """
+        empty = None
+        oldest = None
+        oldest_used = None
+        for offset in self._offsets(key):
+            seq, length, used, written, key_length = HEADER.unpack_from(mm, offset)
+            if not length:
+                if empty is None:
+                    empty = offset
+                continue
+            start = offset + HEADER.size
+            if key_length == len(key) and mm[start:start + key_length] == key:
+                return offset
+            if oldest is None or used < oldest_used:
+                oldest, oldest_used = offset, used
+        return empty if empty is not None else oldest
+
+
+def _encode_key(key):
+    if isinstance(key, bytes):
+        return key
+    return key.encode('utf-8')
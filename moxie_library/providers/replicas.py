@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class Replica(object):
+    """An endpoint of a set of equivalent servers, keeps track of its
+    observed latency and health
+    """
+
+    def __init__(self, host, port, window=50):
+        self.host = host
+        self.port = port
+        self.latencies = deque(maxlen=window)
+        self.failures = 0
+        self.ejected_until = 0
+        self.in_flight = 0
+
+    def __repr__(self):
+        return "{host}:{port}".format(host=self.host, port=self.port)
+
+    def available(self, now):
+        return self.ejected_until <= now
+
+    def score(self):
+        """Expected latency of a request sent to this replica, replicas
+        without any measure are tried first
+        """
+        if not self.latencies:
+            return 0
+        return sorted(self.latencies)[len(self.latencies) // 2] * (1 + self.in_flight)
+
+    def percentile(self, percentile):
+        """Latency under which the given percentile of requests completed
+        :return latency in seconds or None if nothing has been measured
+        """
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100.0))
+        return latencies[index]
+
+
+class ReplicaSet(object):
+    """Balances calls between equivalent replicas by observed latency,
+    hedges slow calls with a duplicate to another replica and ejects
+    replicas failing repeatedly for some time
+    """
+
+    def __init__(self, endpoints, hedge_percentile=95, hedge_delay=1.0, min_hedge_delay=0.05,
+                 min_samples=10, max_failures=3, ejection_time=30, ignore=()):
+        """
+        :param endpoints: list of (host, port)
+        :param hedge_percentile: percentile of the latency of a replica after which
+                                 a duplicate request is sent to another replica
+        :param hedge_delay: delay (seconds) before hedging when not enough latencies have been observed
+        :param min_hedge_delay: lower bound (seconds) of the delay before hedging
+        :param min_samples: number of latencies to observe before using the percentile
+        :param max_failures: number of consecutive failures after which a replica is ejected
+        :param ejection_time: time (seconds) before an ejected replica is tried again
+        :param ignore: exceptions which are not caused by the health of a replica
+                       (e.g. errors in the query)
+        """
+        self.replicas = [Replica(host, port) for host, port in endpoints]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.ignore = tuple(ignore)
+        self._lock = threading.Lock()
+
+    def ranked(self):
+        """Replicas ordered by preference, healthy replicas first
+        """
+        now = time.time()
+        with self._lock:
+            healthy = [r for r in self.replicas if r.available(now)]
+            if healthy:
+                return sorted(healthy, key=lambda r: r.score())
+            # everything has been ejected, try first the one ejected for the longest time
+            return sorted(self.replicas, key=lambda r: r.ejected_until)
+
+    def delay(self, replica):
+        """Time to wait for a replica to answer before hedging
+        """
+        with self._lock:
+            if len(replica.latencies) < self.min_samples:
+                return self.hedge_delay
+            return max(self.min_hedge_delay, replica.percentile(self.hedge_percentile))
+
+    def call(self, fn, discard=None):
+        """Call fn with the best replica, and with the second best replica if the
+        first one does not answer in time. The first successful answer is returned.
+        :param fn: function taking a :py:class:`Replica` as argument
+        :param discard: function called with answers coming after the first one
+        :return value returned by fn
+        """
+        replicas = self.ranked()
+        if len(replicas) == 1:
+            return self._run(replicas[0], fn)
+        race = _Race(discard, self.ignore)
+        self._launch(replicas[0], fn, race)
+        launched = 1
+        # errors in the query would happen on any replica, they are not hedged
+        if not race.wait(self.delay(replicas[0])):
+            logger.debug("Hedging request from %r to %r", replicas[0], replicas[1])
+            self._launch(replicas[1], fn, race)
+            launched += 1
+        return race.result(launched)
+
+    def _launch(self, replica, fn, race):
+        def run():
+            try:
+                value = self._run(replica, fn)
+            except Exception as e:
+                race.fail(e)
+            else:
+                race.succeed(value)
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, replica, fn):
+        with self._lock:
+            replica.in_flight += 1
+        started = time.time()
+        try:
+            value = fn(replica)
+        except self.ignore:
+            self._finished(replica, time.time() - started)
+            raise
+        except Exception:
+            self._failed(replica)
+            raise
+        else:
+            self._finished(replica, time.time() - started)
+            return value
+
+    def _finished(self, replica, latency):
+        with self._lock:
+            replica.in_flight -= 1
+            replica.latencies.append(latency)
+            replica.failures = 0
+            replica.ejected_until = 0
+
+    def _failed(self, replica):
+        with self._lock:
+            replica.in_flight -= 1
+            replica.failures += 1
+            if replica.failures >= self.max_failures:
+                replica.ejected_until = time.time() + self.ejection_time
+                logger.warning("Ejecting replica %r after %d failures", replica, replica.failures)
+
+
+class _Race(object):
+    """Outcome of concurrent calls, the first success wins
+    """
+
+    def __init__(self, discard, ignore=()):
+        """
+        :param discard: function called with answers coming after the first one
+        :param ignore: exceptions ending the race, as they would be raised by any call
+        """
+        self._discard = discard
+        self._ignore = ignore
+        self._condition = threading.Condition()
+        self._winner = None
+        self._final_error = None
+        self._errors = []
+
+    def _decided(self):
+        return self._winner is not None or self._final_error is not None
+
+    def succeed(self, value):
+        with self._condition:
+            # an error ending the race settles it too, later answers are discarded
+            if not self._decided():
+                self._winner = (value,)
+                self._condition.notify_all()
+                return
+        if self._discard:
+            try:
+                self._discard(value)
+            except Exception:
+                logger.warning("Unable to discard answer", exc_info=True)
+
+    def fail(self, error):
+        with self._condition:
+            self._errors.append(error)
+            if self._final_error is None and isinstance(error, self._ignore):
+                self._final_error = error
+            self._condition.notify_all()
+
+    def wait(self, timeout):
+        """Wait for the first call to finish
+        :return True if a call succeeded or failed with an error ending the race
+        """
+        with self._condition:
+            if not self._decided() and not self._errors:
+                self._condition.wait(timeout)
+            return self._decided()
+
+    def result(self, launched):
+        """Wait for the first success, for an error ending the race, or for
+        all the calls to fail
+        """
+        with self._condition:
+            while not self._decided() and len(self._errors) < launched:
+                self._condition.wait()
+            if self._winner is not None:
+                return self._winner[0]
+            raise self._final_error or self._errors[-1]
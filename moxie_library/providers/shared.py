@@ -0,0 +1,32 @@
+"""Objects shared by all the requests served by a process.
+
+Services and providers are created for each application context, state which
+has to build up across requests (latencies of replicas, limits, pollers,
+pools...) is kept here, keyed by its configuration.
+"""
+import threading
+
+_instances = {}
+_lock = threading.Lock()
+
+
+def config_key(value):
+    """Hashable form of a configuration (dicts and lists)
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, config_key(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(config_key(v) for v in value)
+    return value
+
+
+def shared(key, factory):
+    """Object shared by the process for a key, created on first use
+    :param key: hashable key (see config_key)
+    :param factory: function without arguments creating the object
+    """
+    with _lock:
+        instance = _instances.get(key)
+        if instance is None:
+            instance = _instances[key] = factory()
+        return instance
@@ -1,9 +1,36 @@
-from flask import url_for, jsonify
+import datetime
+
+from flask import url_for, jsonify, current_app
+from werkzeug.http import http_date
 
 from moxie.core.service import NoConfiguredService
 from moxie.core.representations import Representation, HALRepresentation, get_nav_links
-from moxie.places.services import POIService
-from moxie.places.representations import HALPOIRepresentation
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _encodable(obj):
+    """Convert dates the way Flask's encoder does, ujson would give timestamps
+    """
+    if isinstance(obj, dict):
+        return dict((k, _encodable(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_encodable(v) for v in obj]
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return http_date(obj.timetuple())
+    return obj
+
+
+def json_response(data):
+    """JSON response serialised with ujson if it is installed, jsonify otherwise
+    """
+    if ujson is None or current_app.debug:
+        return jsonify(data)
+    return current_app.response_class(ujson.dumps(_encodable(data), ensure_ascii=False),
+                                      mimetype='application/json')
 
 
 class LibrariesRepresentation(Representation):
@@ -20,37 +47,48 @@ class LibrariesRepresentation(Representation):
 
 class ItemRepresentation(Representation):
 
-    def __init__(self, item):
+    FIELDS = {
+        'title': lambda item: item.title,
+        'author': lambda item: item.author,
+        'publisher': lambda item: item.publisher,
+        'description': lambda item: item.description,
+        'edition': lambda item: item.edition,
+        'copies': lambda item: item.copies,
+        'holdings': lambda item: LibrariesRepresentation(item.libraries).as_dict(),
+        'isbns': lambda item: item.isbns,
+        'issns': lambda item: item.issns,
+    }
+
+    def __init__(self, item, fields=None):
+        """Representation of an item
+        :param item: domain item to represent
+        :param fields: fields to represent (all fields if None), the ID is always represented
+        """
         self.item = item
+        self.fields = fields
 
     def as_dict(self):
-        libraries = LibrariesRepresentation(self.item.libraries)
-        return {
-            'id': self.item.control_number,
-            'title': self.item.title,
-            'author': self.item.author,
-            'publisher': self.item.publisher,
-            'description': self.item.description,
-            'edition': self.item.edition,
-            'copies': self.item.copies,
-            'holdings': libraries.as_dict(),
-            'isbns': self.item.isbns,
-            'issns': self.item.issns,
-        }
+        out = {'id': self.item.control_number}
+        for name, value in self.FIELDS.items():
+            if self.fields is None or name in self.fields:
+                out[name] = value(self.item)
+        return out
 
     def as_json(self):
-        return jsonify(self.as_dict())
+        return json_response(self.as_dict())
 
 
 class HALItemRepresentation(ItemRepresentation):
 
-    def __init__(self, item, endpoint, place_identifier='olis-aleph'):
+    def __init__(self, item, endpoint, place_identifier='olis-aleph', fields=None):
         """HAL  representation for an item
         :param item: domain item to represent
         :param endpoint: base endpoint (URL)
         :param place_identifier: identifier when searching for places
+        :param fields: fields to represent (all fields if None), places are
+                       only embedded if holdings are requested
         """
-        super(HALItemRepresentation, self).__init__(item)
+        super(HALItemRepresentation, self).__init__(item, fields)
         self.endpoint = endpoint
         self.place_identifier = place_identifier
 
@@ -63,6 +101,13 @@ class HALItemRepresentation(ItemRepresentation):
 
         embedded = None
 
+        if self.fields is not None and 'holdings' not in self.fields:
+            return HALRepresentation(base, links, embedded).as_dict()
+
+        # moxie.places is imported when first needed, not at start-up
+        from moxie.places.services import POIService
+        from moxie.places.representations import HALPOIRepresentation
+
         try:
             poi_service = POIService.from_context()
         except NoConfiguredService:
@@ -78,7 +123,7 @@ class HALItemRepresentation(ItemRepresentation):
         return HALRepresentation(base, links, embedded).as_dict()
 
     def as_json(self):
-        return jsonify(self.as_dict())
+        return json_response(self.as_dict())
 
 
 class ItemsRepresentation(object):
@@ -98,16 +143,17 @@ class ItemsRepresentation(object):
                 'results': [representation(r).as_dict() for r in self.results]}
 
     def as_json(self):
-        return jsonify(self.as_dict())
+        return json_response(self.as_dict())
 
 
 class HALItemsRepresentation(ItemsRepresentation):
 
-    def __init__(self, title, author, isbn, results, start, count, size, endpoint):
+    def __init__(self, title, author, isbn, results, start, count, size, endpoint, fields=None):
         super(HALItemsRepresentation, self).__init__(title, author, isbn, results, size)
         self.start = start
         self.count = count
         self.endpoint = endpoint
+        self.fields = fields
 
     def as_dict(self):
         response = {
@@ -116,14 +162,68 @@ class HALItemsRepresentation(ItemsRepresentation):
             'isbn': self.isbn,
             'size': self.size,
         }
-        items = [HALItemRepresentation(r, 'library.item').as_dict() for r in self.results]
+        items = [HALItemRepresentation(r, 'library.item', fields=self.fields).as_dict() for r in self.results]
+        fields = ','.join(sorted(self.fields)) if self.fields is not None else None
         links = {'self': {
-            'href': url_for(self.endpoint, title=self.title, author=self.author, isbn=self.isbn)
+            'href': url_for(self.endpoint, title=self.title, author=self.author, isbn=self.isbn, fields=fields)
         }
         }
         links.update(get_nav_links(self.endpoint, self.start, self.count, self.size,
-                                   title=self.title, author=self.author, isbn=self.isbn))
+                                   title=self.title, author=self.author, isbn=self.isbn, fields=fields))
         return HALRepresentation(response, links, {'items': items}).as_dict()
 
     def as_json(self):
-        return jsonify(self.as_dict())
+        return json_response(self.as_dict())
+
+
+class HALItemsCountRepresentation(object):
+
+    def __init__(self, title, author, isbn, size, endpoint):
+        self.title = title
+        self.author = author
+        self.isbn = isbn
+        self.size = size
+        self.endpoint = endpoint
+
+    def as_dict(self):
+        response = {
+            'title': self.title,
+            'author': self.author,
+            'isbn': self.isbn,
+            'size': self.size,
+        }
+        links = {'self': {
+            'href': url_for(self.endpoint, title=self.title, author=self.author, isbn=self.isbn, mode='count')
+        }
+        }
+        return HALRepresentation(response, links).as_dict()
+
+    def as_json(self):
+        return json_response(self.as_dict())
+
+
+class HALSuggestionsRepresentation(object):
+
+    def __init__(self, query, suggestions, endpoint):
+        """HAL representation of suggestions
+        :param query: text typed by the user
+        :param suggestions: list of (text, kind)
+        :param endpoint: endpoint of suggestions
+        """
+        self.query = query
+        self.suggestions = suggestions
+        self.endpoint = endpoint
+
+    def as_dict(self):
+        response = {
+            'q': self.query,
+            'suggestions': [{'text': text, 'type': kind} for text, kind in self.suggestions],
+        }
+        links = {'self': {
+            'href': url_for(self.endpoint, q=self.query)
+        }
+        }
+        return HALRepresentation(response, links).as_dict()
+
+    def as_json(self):
+        return json_response(self.as_dict())
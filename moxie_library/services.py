@@ -2,6 +2,10 @@ import logging
 
 from moxie.core.service import Service
 from moxie_library.domain import LibrarySearchQuery, LibrarySearchException
+from moxie_library.suggestions import PrefixIndex
+from moxie_library.slowlog import SlowQueryLog
+from moxie_library.negative_cache import NegativeCache
+from moxie_library.providers.shared import shared, config_key
 
 logger = logging.getLogger(__name__)
 
@@ -10,10 +14,29 @@ class LibrarySearchService(Service):
     """Library search service
     """
 
-    def __init__(self, search_provider_config=None):
+    def __init__(self, search_provider_config=None, suggestions_dump=None, suggestions_size=100000,
+                 slow_query_log=None, negative_cache=None):
+        """
+        :param search_provider_config: provider of search
+        :param suggestions_dump: path to a dump of titles and authors to suggest
+        :param suggestions_size: maximum number of titles and authors kept to suggest
+        :param slow_query_log: options of the log of slow queries (path, threshold,
+                               sample_rate, max_records), no log if None
+        :param negative_cache: options of the cache of unknown items and searches
+                               without results (timeout, max_size)
+        """
         self.searcher = self._import_provider(search_provider_config.items()[0])
+        self.suggestions_dump = suggestions_dump
+        # shared by the process, services are created for each application context
+        self.suggestions = shared(('suggestions', suggestions_size), lambda: PrefixIndex(suggestions_size))
+        slow_query_log = slow_query_log or {}
+        self.slow_query_log = shared(('slow_query_log', config_key(slow_query_log)),
+                                     lambda: SlowQueryLog(**slow_query_log))
+        negative_cache = negative_cache or {}
+        self.misses = shared(('negative_cache', config_key(negative_cache)),
+                             lambda: NegativeCache(**negative_cache))
 
-    def search(self, title, author, isbn, availability, start=0, count=10):
+    def search(self, title, author, isbn, availability, start=0, count=10, fields=None):
         """Search for media in the given provider.
         :param title: title
         :param author: author
@@ -21,20 +44,119 @@ class LibrarySearchService(Service):
         :param availability: annotate result with availability information
         :param start: first result to return
         :param count: number of results to return
+        :param fields: fields required (all fields if None)
         :return list of results
         """
 
+        with self.slow_query_log.capture('search') as capture:
+            with capture.stage('query'):
+                query = LibrarySearchQuery(title, author, isbn)
+            key = search_key(query)
+            if key in self.misses:
+                return 0, []
+            with capture.stage('search'):
+                size, results = self.searcher.library_search(query, start, count, availability=availability,
+                                                             fields=fields)
+            if not size:
+                self.misses.add(key)
+            if capture:
+                capture.query = normalised_query(query, start=start, count=count, availability=availability)
+                capture.size = size
+                # results are parsed (and annotated) when consumed
+                with capture.stage('parse'):
+                    results = list(results)
+                capture.add_results(results)
+        return size, index_results(results, self.suggestions)
+
+    def suggest(self, prefix, count=10):
+        """Suggest titles and authors from results seen previously
+        :param prefix: beginning of a title or author
+        :param count: maximum number of suggestions
+        :return list of (text, kind)
+        """
+        if self.suggestions_dump:
+            self.suggestions.load_dump(self.suggestions_dump)
+        return self.suggestions.suggest(prefix, count)
+
+    def count(self, title, author, isbn):
+        """Count results of a search in the given provider, without getting results.
+        :param title: title
+        :param author: author
+        :param isbn: isbn
+        :return total size of results
+        """
+
+        query = LibrarySearchQuery(title, author, isbn)
+        key = search_key(query)
+        if key in self.misses:
+            return 0
+        size, results = self.searcher.library_search(query, 0, 0, count_only=True)
+        if not size:
+            self.misses.add(key)
+        return size
+
+    def export(self, title, author, isbn, availability=False, chunk_size=100, fields=None):
+        """Search once in the given provider and stream all results.
+        :param title: title
+        :param author: author
+        :param isbn: isbn
+        :param availability: annotate results with availability information
+        :param chunk_size: number of records fetched from the provider at once
+        :param fields: fields required (all fields if None)
+        :return total size of results, generator of results
+        """
+
         query = LibrarySearchQuery(title, author, isbn)
-        size, results = self.searcher.library_search(query, start, count, availability=availability)
-        return size, results
+        return self.searcher.library_export(query, chunk_size=chunk_size, availability=availability,
+                                            fields=fields)
 
-    def get_media(self, control_number, availability):
+    def get_media(self, control_number, availability, fields=None):
         """Get a media by its control number
         :param control_number: ID of the media
         :param availability: annotate item with availability information
+        :param fields: fields required (all fields if None)
         :return result or None
         """
-        return self.searcher.control_number_search(control_number, availability=availability)
+        key = ('media', control_number)
+        if key in self.misses:
+            return None
+        with self.slow_query_log.capture('media') as capture:
+            with capture.stage('search'):
+                result = self.searcher.control_number_search(control_number, availability=availability,
+                                                             fields=fields)
+            if capture:
+                capture.query = {'control_number': control_number, 'availability': availability}
+                capture.size = 1 if result else 0
+                capture.add_results([result] if result else [])
+        if result:
+            self.suggestions.add_result(result)
+        else:
+            self.misses.add(key)
+        return result
+
+
+def search_key(query):
+    """Key of a query in the cache of searches without results
+    """
+    return ('search', query.title, query.author, query.isbns, query.issn)
+
+
+def normalised_query(query, **kwargs):
+    """Query as a dictionary, for logging
+    """
+    out = {'title': query.title, 'author': query.author, 'isbn': query.isbn,
+           'issn': query.issn, 'removed': sorted(query.removed)}
+    out.update(kwargs)
+    return out
+
+
+def index_results(results, index):
+    """Feed suggestions with results as they are consumed
+    :param index: PrefixIndex of suggestions
+    """
+    for result in results:
+        index.add_result(result)
+        yield result
 
 
 def removeNonAscii(s):
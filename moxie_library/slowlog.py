@@ -0,0 +1,217 @@
+"""Sampled log of slow searches, capturing what is needed to replay them
+offline (normalised query, timings, raw records and availability XML).
+
+Captures are appended to a file, one JSON object per line, and can be
+replayed through the parsing and rendering code for profiling:
+
+    python -m moxie_library.slowlog captures.log [--encoding marc8] [--profile]
+"""
+import argparse
+import base64
+import fcntl
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class Capture(object):
+    """Timings and data of a sampled request
+    """
+
+    def __init__(self, log, kind):
+        self.log = log
+        self.kind = kind
+        self.started = time.time()
+        self.query = None
+        self.size = None
+        self.timings = []
+        self.records = []
+        self.availability = []
+
+    def __nonzero__(self):
+        return True
+    __bool__ = __nonzero__
+
+    def __enter__(self):
+        _local.capture = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.capture = None
+        elapsed = time.time() - self.started
+        if elapsed >= self.log.threshold:
+            self.log.write(self.as_dict(elapsed, exc_value))
+
+    @contextmanager
+    def stage(self, name):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.timings.append((name, time.time() - started))
+
+    def add_results(self, results):
+        """Keep raw records of results
+        """
+        for result in results:
+            raw = getattr(result, 'raw', None)
+            if raw is not None and len(self.records) < self.log.max_records:
+                self.records.append(raw)
+
+    def as_dict(self, elapsed, error=None):
+        return {
+            'kind': self.kind,
+            'time': self.started,
+            'elapsed': elapsed,
+            'error': repr(error) if error else None,
+            'query': self.query,
+            'size': self.size,
+            'timings': self.timings,
+            'records': [base64.b64encode(record).decode('ascii') for record in self.records],
+            'availability': [(control_number, base64.b64encode(xml).decode('ascii'), seconds)
+                             for control_number, xml, seconds in self.availability],
+        }
+
+
+class NullCapture(object):
+    """Stands for a capture when the request is not sampled
+    """
+
+    def __nonzero__(self):
+        return False
+    __bool__ = __nonzero__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def add_results(self, results):
+        pass
+
+NULL_CAPTURE = NullCapture()
+
+
+class SlowQueryLog(object):
+
+    def __init__(self, path=None, threshold=1.0, sample_rate=0.1, max_records=50):
+        """
+        :param path: file to append captures to, nothing is captured if None
+        :param threshold: time (seconds) above which a sampled request is written
+        :param sample_rate: proportion of requests which are timed and captured
+        :param max_records: maximum number of raw records kept per capture
+        """
+        self.path = path
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.max_records = max_records
+
+    def capture(self, kind):
+        """Start capturing a request if it is sampled
+        :param kind: type of request (e.g. "search")
+        :return context manager, false if the request is not sampled
+        """
+        if self.path and random.random() < self.sample_rate:
+            return Capture(self, kind)
+        return NULL_CAPTURE
+
+    def write(self, capture):
+        """Append a capture, the file is written by all the workers of a host:
+        each line is written with a single write on a file opened for
+        appending, under a lock on the file
+        """
+        line = json.dumps(capture) + '\n'
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except (IOError, OSError):
+            logger.warning("Unable to write slow query", exc_info=True)
+
+
+def record_availability(control_number, xml, seconds):
+    """Keep availability information from Aleph if the current request is
+    captured
+    """
+    capture = getattr(_local, 'capture', None)
+    if capture is not None:
+        capture.availability.append((control_number, xml, seconds))
+
+
+def replay(captures, results_encoding='marc8'):
+    """Parse and render again records of captures
+    :param captures: list of captures (as written in the log)
+    :return list of timings (parse, availability, render) per capture
+    """
+    from moxie_library.providers.oxford_z3950 import OXMARCSearchResult, RawRecord
+    from moxie_library.representations import ItemRepresentation
+
+    timings = []
+    for capture in captures:
+        availability = dict((control_number, base64.b64decode(xml))
+                            for control_number, xml, seconds in capture['availability'])
+        started = time.time()
+        results = [OXMARCSearchResult(RawRecord(base64.b64decode(record)), results_encoding=results_encoding,
+                                      availability=False, aleph_url='')
+                   for record in capture['records']]
+        parsed = time.time()
+        for result in results:
+            if result.control_number in availability:
+                result.parse_availability(availability[result.control_number])
+        annotated = time.time()
+        for result in results:
+            ItemRepresentation(result).as_dict()
+        rendered = time.time()
+        timings.append((parsed - started, annotated - parsed, rendered - annotated))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured slow queries")
+    parser.add_argument('log')
+    parser.add_argument('--encoding', default='marc8')
+    parser.add_argument('--profile', action='store_true', help="profile the replay")
+    args = parser.parse_args()
+
+    with open(args.log) as f:
+        captures = [json.loads(line) for line in f if line.strip()]
+
+    if args.profile:
+        import cProfile
+        import pstats
+        profile = cProfile.Profile()
+        timings = profile.runcall(replay, captures, args.encoding)
+        pstats.Stats(profile, stream=sys.stdout).sort_stats('cumulative').print_stats(30)
+    else:
+        timings = replay(captures, args.encoding)
+
+    for capture, (parse, availability, render) in zip(captures, timings):
+        sys.stdout.write("{kind} {query} size={size} elapsed={elapsed:.3f}s stages={stages} | "
+                         "replay: parse={parse:.1f}ms availability={availability:.1f}ms render={render:.1f}ms\n".format(
+                             kind=capture['kind'], query=json.dumps(capture['query']), size=capture['size'],
+                             elapsed=capture['elapsed'],
+                             stages=' '.join('{0}={1:.3f}s'.format(name, seconds) for name, seconds in capture['timings']),
+                             parse=parse * 1000, availability=availability * 1000, render=render * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import bisect
+import io
+import logging
+import re
+import threading
+
+from moxie_library.domain import LibrarySearchQuery
+
+logger = logging.getLogger(__name__)
+
+TITLE = 'title'
+AUTHOR = 'author'
+
+# maximum number of keys looked at for a prefix
+MAX_SCAN = 1000
+
+NON_WORD = re.compile(r'[^\w ]+', re.UNICODE)
+SPACES = re.compile(r'\s+', re.UNICODE)
+TRAILING_PUNCTUATION = ' /:;,.='
+
+
+def to_unicode(text):
+    """Titles and authors are UTF-8 encoded strings when records are not
+    MARC-8 encoded, keys have to be unicode to be compared
+    """
+    if isinstance(text, bytes):
+        return text.decode('utf-8', 'replace')
+    return text
+
+
+def simplify(text):
+    """Lowercase text without punctuation, words separated by a single space
+    """
+    text = to_unicode(text)
+    return SPACES.sub(' ', NON_WORD.sub(' ', text.lower())).strip()
+
+
+def normalise(text):
+    """Normalise titles and authors, lowercase, without punctuation or stop
+    words. Titles only made of stop words (e.g. "The Who") keep them.
+    """
+    simplified = simplify(text)
+    cleaned, removed = LibrarySearchQuery._clean_input(simplified)
+    return cleaned or simplified
+
+
+def prefix_keys(prefix):
+    """Keys to look up for a prefix typed by a user: stop words are removed
+    from complete words only, the last word may still be being typed (e.g.
+    "in" of "india"). The prefix without removing stop words is also looked
+    up, for entries which kept their stop words.
+    """
+    prefix = to_unicode(prefix)
+    simplified = simplify(prefix)
+    if not simplified:
+        return []
+    words = simplified.split(' ')
+    if prefix[-1:].isalnum():
+        words, last = words[:-1], words[-1]
+    else:
+        last = ''
+    cleaned, removed = LibrarySearchQuery._clean_input(' '.join(words))
+    key = ' '.join(part for part in (cleaned, last) if part)
+    keys = [key] if key else []
+    if simplified != key:
+        keys.append(simplified)
+    return keys
+
+
+class PrefixIndex(object):
+    """Index of titles and authors by prefix of their normalised form, kept
+    as a sorted array of keys searched by bisection. The number of entries
+    is bounded, the least requested entries are evicted first.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._keys = []
+        self._entries = {}
+        self._dumps = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, text, kind, weight=1):
+        """Add a title or an author, or increase its weight if already indexed
+        :param text: text to suggest
+        :param kind: TITLE or AUTHOR
+        :param weight: weight of the entry when ranking suggestions
+        """
+        if not text:
+            return
+        text = to_unicode(text).strip(TRAILING_PUNCTUATION)
+        key = normalise(text)
+        if not key:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry[2] += weight
+                return
+            if len(self._keys) >= self.max_entries:
+                self._evict()
+            bisect.insort(self._keys, key)
+            self._entries[key] = [text, kind, weight]
+
+    def add_result(self, result):
+        """Index title and author of a search result
+        """
+        self.add(getattr(result, 'short_title', None) or result.title, TITLE)
+        self.add(result.author, AUTHOR)
+
+    def load_dump(self, path):
+        """Index a dump of titles and authors, each line being
+        "kind<TAB>text" or "kind<TAB>text<TAB>weight". A dump is only loaded once.
+        """
+        with self._lock:
+            if path in self._dumps:
+                return
+            self._dumps.add(path)
+        with io.open(path, encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                try:
+                    weight = int(parts[2]) if len(parts) > 2 else 1
+                    self.add(parts[1], parts[0], weight)
+                except (IndexError, ValueError):
+                    logger.warning("Invalid line in dump of suggestions: %r", line)
+
+    def suggest(self, prefix, count=10):
+        """Suggest titles and authors starting with a prefix
+        :param prefix: text typed by the user
+        :param count: maximum number of suggestions
+        :return list of (text, kind), heaviest first
+        """
+        matches = {}
+        with self._lock:
+            for key in prefix_keys(prefix):
+                index = bisect.bisect_left(self._keys, key)
+                for candidate in self._keys[index:index + MAX_SCAN]:
+                    if not candidate.startswith(key):
+                        break
+                    matches[candidate] = self._entries[candidate]
+        matches = list(matches.values())
+        matches.sort(key=lambda entry: entry[2], reverse=True)
+        return [(text, kind) for text, kind, weight in matches[:count]]
+
+    def _evict(self):
+        """Drop the lightest tenth of entries, lock must be held
+        """
+        by_weight = sorted(self._entries, key=lambda key: self._entries[key][2])
+        for key in by_weight[:max(1, len(by_weight) // 10)]:
+            del self._entries[key]
+        self._keys = sorted(self._entries)
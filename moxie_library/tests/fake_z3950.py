@@ -0,0 +1,140 @@
+"""Fake Z39.50 server serving canned USMARC records, with configurable
+latency and error injection.
+
+    python -m moxie_library.tests.fake_z3950 --port 2100 --latency 0.05 --errors 0.01
+"""
+import argparse
+import logging
+import random
+import re
+import socket
+import threading
+import time
+
+from PyZ3950 import z3950, asn1
+from PyZ3950.oids import Z3950_RECSYN_USMARC_ov
+
+from moxie_library.tests.records import canned_record
+
+logger = logging.getLogger(__name__)
+
+CONTROL_NUMBER = re.compile(r'^\d{9}$')
+
+
+def _terms(value):
+    """Terms of a (decoded) RPN query"""
+    if isinstance(value, basestring):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            for term in _terms(v):
+                yield term
+    elif hasattr(value, '__dict__'):
+        for v in vars(value).values():
+            for term in _terms(v):
+                yield term
+
+
+class FakeServer(z3950.Server):
+    """Answers every search with `hits` records, except searches for a control
+    number which give this record only
+    """
+
+    hits = 200
+    latency = 0.0
+    jitter = 0.0
+    errors = 0.0
+
+    def _delay(self):
+        time.sleep(max(0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.errors:
+            # the connection is dropped abruptly
+            self.done = 1
+            self.sock.close()
+            raise socket.error("injected error")
+
+    def search_child(self, query):
+        numbers = [int(term) for term in _terms(query) if CONTROL_NUMBER.match(term)]
+        if numbers:
+            return numbers[:1]
+        seed = sum(ord(c) for c in repr(query))
+        return range(seed, seed + self.hits)
+
+    def search(self, sreq):
+        self._delay()
+        z3950.Server.search(self, sreq)
+
+    def present(self, preq):
+        self._delay()
+        z3950.Server.present(self, preq)
+
+    def format_records(self, start, count, res_set, prefsyn):
+        records = []
+        for i in range(start - 1, min(start + count - 1, len(res_set))):
+            external = asn1.EXTERNAL()
+            external.direct_reference = Z3950_RECSYN_USMARC_ov
+            external.encoding = ('octet-aligned', canned_record(res_set[i]))
+            record = z3950.NamePlusRecord()
+            record.name = 'fake'
+            record.record = ('retrievalRecord', external)
+            records.append(record)
+        return records
+
+    fn_dict = dict(z3950.Server.fn_dict, searchRequest=search, presentRequest=present)
+
+
+def serve(port, hits=200, latency=0.0, jitter=0.0, errors=0.0):
+    """Serve forever, each connection in its own thread
+    :param port: port to listen to (0 for any)
+    :return listening socket
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', port))
+    listener.listen(128)
+
+    # z3950.Server is a classic class, type() cannot be used
+    class ConfiguredFakeServer(FakeServer):
+        pass
+    ConfiguredFakeServer.hits = hits
+    ConfiguredFakeServer.latency = latency
+    ConfiguredFakeServer.jitter = jitter
+    ConfiguredFakeServer.errors = errors
+    server = ConfiguredFakeServer
+
+    def handle(sock):
+        try:
+            server(sock).run()
+        except Exception:
+            logger.debug("Connection closed", exc_info=True)
+        finally:
+            sock.close()
+
+    def accept():
+        while True:
+            sock, address = listener.accept()
+            thread = threading.Thread(target=handle, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=accept)
+    thread.daemon = True
+    thread.start()
+    return listener
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=2100)
+    parser.add_argument('--hits', type=int, default=200, help="number of results of searches")
+    parser.add_argument('--latency', type=float, default=0.0, help="mean latency (seconds) of answers")
+    parser.add_argument('--jitter', type=float, default=0.0, help="standard deviation of the latency")
+    parser.add_argument('--errors', type=float, default=0.0, help="probability of dropping a connection")
+    args = parser.parse_args()
+    serve(args.port, args.hits, args.latency, args.jitter, args.errors)
+    while True:
+        time.sleep(3600)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Canned MARC records served by the fake Z39.50 and Aleph servers."""
+
+SHELFMARKS = ('M.{0}', 'Per. {0} d.12', 'ZZ {0}')
+LIBRARIES = (('BODBL', 'STACK'), ('SACBL', 'OPEN'), ('RSL', 'REF'))
+AVAILABILITIES = ('Available', 'Reference', 'Missing', '12/10/13', 'In place*')
+
+
+def control_number(n):
+    return '{0:09d}'.format(n)
+
+
+def build_record(fields):
+    """Build an ISO 2709 record
+    :param fields: list of (tag, content), content of data fields including
+                   indicators and subfield delimiters
+    """
+    data = b''
+    directory = b''
+    for tag, content in fields:
+        content += b'\x1e'
+        directory += '{0:03d}{1:04d}{2:05d}'.format(tag, len(content), len(data)).encode('ascii')
+        data += content
+    directory += b'\x1e'
+    base = 24 + len(directory)
+    length = base + len(data) + 1
+    leader = '{0:05d}nam a22{1:05d} a 4500'.format(length, base).encode('ascii')
+    return leader + directory + data + b'\x1d'
+
+
+def holdings(n):
+    """Holdings of record n: list of (library, location, shelfmark)"""
+    out = []
+    for copy in range(1 + n % 3):
+        library, location = LIBRARIES[(n + copy) % len(LIBRARIES)]
+        out.append((library, location, SHELFMARKS[copy % len(SHELFMARKS)].format(n)))
+    return out
+
+
+def canned_record(n):
+    fields = [
+        (1, control_number(n).encode('ascii')),
+        (20, '  \x1fa{0:010d}'.format(n).encode('ascii')),
+        (100, '1 \x1faAuthor, Test {0}.'.format(n).encode('ascii')),
+        (245, '10\x1faLoad test record {0} /\x1fcby Test Author {0}.'.format(n).encode('ascii')),
+        (260, '  \x1faOxford :\x1fbMoxie,\x1fc2013.'.encode('ascii')),
+        (300, '  \x1fa{0} p. ;\x1fc24 cm.'.format(100 + n % 400).encode('ascii')),
+    ]
+    for library, location, shelfmark in holdings(n):
+        fields.append((852, '  \x1fb{0}\x1fc{1}\x1fh{2}'.format(library, location, shelfmark).encode('ascii')))
+    return build_record(fields)
+
+
+def circ_status(n):
+    """Aleph circ-status XML for record n"""
+    items = []
+    for copy, (library, location, shelfmark) in enumerate(holdings(n)):
+        items.append('<item-data><location>{0}</location><due-date>{1}</due-date></item-data>'.format(
+            shelfmark, AVAILABILITIES[(n + copy) % len(AVAILABILITIES)]))
+    return '<?xml version="1.0"?><circ-status>{0}</circ-status>'.format(''.join(items)).encode('ascii')
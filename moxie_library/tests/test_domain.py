@@ -0,0 +1,39 @@
+import unittest
+
+from moxie_library.domain import LibrarySearchQuery
+
+
+class ISBNTestCase(unittest.TestCase):
+
+    def assertInvalid(self, isbn, msg):
+        with self.assertRaises(LibrarySearchQuery.InconsistentQuery) as context:
+            LibrarySearchQuery(isbn=isbn)
+        self.assertEqual(context.exception.msg, msg)
+
+    def test_isbn10(self):
+        query = LibrarySearchQuery(isbn='0-306-40615-2')
+        self.assertEqual(query.isbns, ('9780306406157', '0306406152'))
+
+    def test_isbn13(self):
+        query = LibrarySearchQuery(isbn='978-0-306-40615-7')
+        self.assertEqual(query.isbns, ('9780306406157', '0306406152'))
+
+    def test_check_digit_x(self):
+        query = LibrarySearchQuery(isbn='0-8044-2957-*')
+        self.assertEqual(query.isbns, ('9780804429573', '080442957X'))
+
+    def test_979_prefix(self):
+        query = LibrarySearchQuery(isbn='9791234567896')
+        self.assertEqual(query.isbns, ('9791234567896',))
+
+    def test_wrong_length(self):
+        self.assertInvalid('123', "Invalid ISBN: an ISBN has 10 or 13 digits.")
+        self.assertInvalid('97803064061571', "Invalid ISBN: an ISBN has 10 or 13 digits.")
+
+    def test_wrong_check_digit(self):
+        self.assertInvalid('0306406153', "Invalid ISBN: wrong check digit.")
+        self.assertInvalid('9780306406158', "Invalid ISBN: wrong check digit.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from moxie_library import iso2709, marc8
+from moxie_library.providers.oxford_z3950 import USMARCSearchResult
+from moxie_library.tests.records import canned_record
+
+try:
+    from PyZ3950 import zmarc
+except ImportError:
+    zmarc = None
+
+
+class ISO2709TestCase(unittest.TestCase):
+
+    def test_is_record(self):
+        record = canned_record(1)
+        self.assertTrue(iso2709.is_record(record))
+        self.assertFalse(iso2709.is_record(record[:-1]))
+        self.assertFalse(iso2709.is_record(record + b' '))
+
+    def test_parse(self):
+        control_number, metadata = iso2709.parse(canned_record(7), marc8.decode)
+        self.assertEqual(control_number, '000000007')
+        self.assertEqual(metadata[245], [{'a': [u'Load test record 7 /'], 'c': [u'by Test Author 7.']}])
+        self.assertEqual(len(metadata[852]), 2)
+
+    def test_malformed(self):
+        record = canned_record(1)
+        self.assertRaises(iso2709.ISO2709Error, iso2709.parse, record[:12] + b'xxxxx' + record[17:])
+
+
+@unittest.skipIf(zmarc is None, "PyZ3950 is not installed")
+class CompareParsersTestCase(unittest.TestCase):
+    """The ISO 2709 parser gives the same records as the parser of the
+    text rendering of PyZ3950
+    """
+
+    def test_text_rendering_is_not_a_record(self):
+        text = str(zmarc.MARC(canned_record(1), strict=0))
+        self.assertFalse(iso2709.is_record(text))
+
+    def test_canned_records(self):
+        for n in range(100):
+            record = canned_record(n)
+            text = str(zmarc.MARC(record, strict=0))
+            self.assertEqual(iso2709.parse(record, marc8.decode),
+                             USMARCSearchResult.parse_text(text, marc8.decode))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from moxie_library import marc8
+
+
+class Marc8TestCase(unittest.TestCase):
+
+    def test_ascii(self):
+        decoded = marc8.decode(b'Introduction to algorithms')
+        self.assertEqual(decoded, u'Introduction to algorithms')
+        self.assertIsInstance(decoded, type(u''))
+
+    def test_extended_latin(self):
+        self.assertEqual(marc8.decode(b'\xa5ther'), u'Æther')
+
+    def test_combining_mark_follows_character(self):
+        # combining marks precede the character they modify in MARC-8
+        self.assertEqual(marc8.decode(b'Caf\xe2e'), u'Café')
+        self.assertEqual(marc8.decode(b'\xe8uber alles'), u'über alles')
+
+    def test_combining_marks_before_space(self):
+        self.assertEqual(marc8.decode(b'a\xe2 b'), u'a \u0301b')
+
+    def test_g0_escape(self):
+        self.assertEqual(marc8.decode(b'H\x1bb2\x1bsO'), u'H₂O')
+        self.assertEqual(marc8.decode(b'\x1b(NAB\x1b(B AB'), u'аб AB')
+
+    def test_g1_escape(self):
+        self.assertEqual(marc8.decode(b'\x1b)N\xc1\xc2'), u'аб')
+
+    def test_multibyte_replaced(self):
+        self.assertEqual(marc8.decode(b'\x1b$1!0#\x1b(Bx'), marc8.REPLACEMENT + u'x')
+
+    def test_unicode_passed_through(self):
+        self.assertEqual(marc8.decode(u'Café'), u'Café')
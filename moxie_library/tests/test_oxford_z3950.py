@@ -0,0 +1,115 @@
+import socket
+import threading
+import time
+import unittest
+
+from moxie.core.exceptions import ServiceUnavailable
+from moxie_library.domain import LibrarySearchQuery
+from moxie_library.providers.oxford_z3950 import Z3950, USMARCSearchResult, OXMARCSearchResult
+from moxie_library.tests.records import build_record
+
+try:
+    from moxie_library.tests import fake_z3950
+except ImportError:
+    # PyZ3950 is needed by the fake server
+    fake_z3950 = None
+
+LATENCY = 0.5
+SHORT_TIMEOUT = 0.2
+LONG_TIMEOUT = 3
+THREADS = 10
+
+
+@unittest.skipIf(fake_z3950 is None, "PyZ3950 is not installed")
+class TimeoutIsolationTestCase(unittest.TestCase):
+    """Concurrent searches with different timeouts against a slow server,
+    the timeout of a search must not apply to other searches
+    """
+
+    def setUp(self):
+        self.listener = fake_z3950.serve(0, hits=20, latency=LATENCY)
+        port = self.listener.getsockname()[1]
+        self.short = Z3950('127.0.0.1', 'test', port=port, timeout=SHORT_TIMEOUT)
+        self.long = Z3950('127.0.0.1', 'test', port=port, timeout=LONG_TIMEOUT)
+
+    def tearDown(self):
+        self.listener.close()
+
+    def test_concurrent_timeouts(self):
+        outcomes = {}
+        lock = threading.Lock()
+        start = threading.Event()
+
+        def search(name, provider, i):
+            start.wait()
+            started = time.time()
+            try:
+                size, results = provider.library_search(LibrarySearchQuery(title='test %d' % i), 0, 5)
+                outcome = len(list(results))
+            except ServiceUnavailable:
+                outcome = 'unavailable'
+            with lock:
+                outcomes[(name, i)] = (outcome, time.time() - started)
+
+        threads = []
+        for i in range(THREADS):
+            threads.append(threading.Thread(target=search, args=('short', self.short, i)))
+            threads.append(threading.Thread(target=search, args=('long', self.long, i)))
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), THREADS * 2)
+        for (name, i), (outcome, elapsed) in outcomes.items():
+            if name == 'short':
+                self.assertEqual(outcome, 'unavailable')
+                self.assertLess(elapsed, LATENCY)
+            else:
+                self.assertEqual(outcome, 5)
+        # the process-wide default is left alone
+        self.assertIsNone(socket.getdefaulttimeout())
+
+
+class ParseRecordTestCase(unittest.TestCase):
+
+    class Record(object):
+        def __init__(self, data):
+            self.data = data
+
+    def test_marc8_record(self):
+        data = build_record([(1, b'000000001'), (245, b'10\x1faCaf\xe2e society')])
+        data = data[:9] + b' ' + data[10:]
+        parsed = USMARCSearchResult.parse_record(self.Record(data), 'marc8')
+        self.assertEqual(parsed.metadata[245][0]['a'], [u'Caf\xe9 society'])
+
+    def test_unicode_record(self):
+        # leader/09 is 'a', the record is not MARC-8 encoded
+        data = build_record([(1, b'000000001'), (245, b'10\x1faCaf\xc3\xa9 society')])
+        data = data[:9] + b'a' + data[10:]
+        parsed = USMARCSearchResult.parse_record(self.Record(data), 'marc8')
+        self.assertEqual(parsed.metadata[245][0]['a'], [b'Caf\xc3\xa9 society'])
+
+
+class AvailabilityTestCase(unittest.TestCase):
+
+    def result(self):
+        data = build_record([(1, b'000000001'), (245, b'10\x1faTitle'),
+                             (852, b'  \x1fbBODBL\x1fcSTACK\x1fhM.1')])
+        return OXMARCSearchResult(ParseRecordTestCase.Record(data), results_encoding='marc8',
+                                  availability=False, aleph_url='')
+
+    def test_empty_due_date(self):
+        for due_date in (None, ''):
+            result = self.result()
+            result.apply_availability([('M.1', due_date)])
+            book = list(result.libraries.values())[0][0]
+            self.assertEqual(book['availability_display'], '')
+
+    def test_due_date_from_aleph(self):
+        result = self.result()
+        result.parse_availability(b'<circ-status><item-data><location>M.1</location>'
+                                  b'<due-date/></item-data></circ-status>')
+        book = list(result.libraries.values())[0][0]
+        self.assertIn('availability', book)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from moxie_library.suggestions import PrefixIndex, TITLE, AUTHOR, normalise, prefix_keys
+
+
+class NormaliseTestCase(unittest.TestCase):
+
+    def test_stop_words(self):
+        self.assertEqual(normalise(u'The Lord of the Rings /'), u'lord rings')
+
+    def test_only_stop_words(self):
+        self.assertEqual(normalise(u'The Who'), u'the who')
+
+    def test_prefix_last_word(self):
+        self.assertEqual(prefix_keys(u'in'), [u'in'])
+        self.assertEqual(prefix_keys(u'the lord o'), [u'lord o', u'the lord o'])
+
+    def test_prefix_complete_words(self):
+        self.assertEqual(prefix_keys(u'the lord of '), [u'lord', u'the lord of'])
+        self.assertEqual(prefix_keys(u'  '), [])
+
+
+class PrefixIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.add(u'India : a history', TITLE, 3)
+        self.index.add(u'Mead, Margaret', AUTHOR, 2)
+        self.index.add(u'The Who', TITLE)
+        self.index.add(u'The Lord of the Rings', TITLE)
+
+    def test_stop_word_prefixes(self):
+        self.assertEqual(self.index.suggest(u'in'), [(u'India : a history', TITLE)])
+        self.assertEqual(self.index.suggest(u'me'), [(u'Mead, Margaret', AUTHOR)])
+
+    def test_stop_words_titles(self):
+        self.assertEqual(self.index.suggest(u'the w'), [(u'The Who', TITLE)])
+        self.assertEqual(self.index.suggest(u'the lo'), [(u'The Lord of the Rings', TITLE)])
+
+    def test_ranking(self):
+        self.index.add(u'Indian summer', TITLE)
+        self.assertEqual(self.index.suggest(u'ind', 1), [(u'India : a history', TITLE)])
+
+    def test_eviction(self):
+        index = PrefixIndex(max_entries=10)
+        for i in range(20):
+            index.add(u'Title %d' % i, TITLE, weight=i)
+        self.assertTrue(len(index) <= 10)
+        self.assertEqual(index.suggest(u'title', 1), [(u'Title 19', TITLE)])
+
+
+if __name__ == '__main__':
+    unittest.main()
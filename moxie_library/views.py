@@ -1,22 +1,147 @@
+import hashlib
 import logging
 
-from flask import request
+from flask import request, current_app, json, stream_with_context
 
 from moxie.core.views import ServiceView, accepts
 from moxie.core.cache import cache, args_cache_key
 from moxie.core.exceptions import BadRequest, NotFound
 from moxie.core.representations import JSON, HAL_JSON
-from moxie_library.domain import LibrarySearchException, LibrarySearchQuery
-from moxie_library.representations import HALItemsRepresentation, HALItemRepresentation
+from moxie_library.domain import LibrarySearchException, LibrarySearchQuery, LibrarySearchResult
+from moxie_library.representations import (ItemRepresentation, HALItemsRepresentation, HALItemRepresentation,
+                                            HALItemsCountRepresentation, HALSuggestionsRepresentation)
 from moxie_library.services import LibrarySearchService
+from moxie_library.warmup import record_hit, SEARCH_HITS_KEY, ITEM_HITS_KEY, WARMUP_HEADER
 
 logger = logging.getLogger(__name__)
 
+EXPORT_MAX_CHUNK_SIZE = 500
+COUNT_CACHE_TIMEOUT = 600
+SUGGESTIONS_MAX_COUNT = 20
 
-class Search(ServiceView):
+# configuration key of the timeout of rendered responses, they are not cached if unset
+RENDERED_CACHE_TIMEOUT = 'LIBRARY_RENDERED_CACHE_TIMEOUT'
+
+
+def count_cache_key():
+    return 'count:{key}'.format(key=args_cache_key())
+
+
+class ConditionalMixin(object):
+    """Adds an ETag to successful responses, and answers 304 Not Modified
+    to conditional requests for a resource which did not change
+    """
+
+    etag = None
+
+    def not_modified(self, etag):
+        """Set the ETag of the response
+        :return a 304 response if the client has this version already, None otherwise
+        """
+        self.etag = etag
+        if etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        return None
+
+    def dispatch_request(self, *args, **kwargs):
+        response = super(ConditionalMixin, self).dispatch_request(*args, **kwargs)
+        if self.etag and response.status_code == 200:
+            response.set_etag(self.etag)
+        return response
+
+
+class HitsMixin(object):
+    """Counts successful requests, so that the most requested ones can be
+    replayed when warming up caches
+    """
+
+    hits_key = None
+
+    def counts_hit(self):
+        return WARMUP_HEADER not in request.headers
+
+    def dispatch_request(self, *args, **kwargs):
+        response = super(HitsMixin, self).dispatch_request(*args, **kwargs)
+        if response.status_code == 200 and self.counts_hit():
+            record_hit(self.hits_key, request.full_path)
+        return response
+
+
+class RenderedCacheMixin(ConditionalMixin):
+    """Keeps the serialised body of successful responses per URL and
+    representation, so that a hit does not go through the service and the
+    representation again
+    """
+
+    rendered = False
+
+    def rendered_cache_key(self):
+        mimetype = request.accept_mimetypes.best_match([HAL_JSON, JSON])
+        return 'rendered:{mimetype}:{key}'.format(mimetype=mimetype, key=args_cache_key())
+
+    def cached_response(self):
+        """Response from the cache of rendered responses
+        :return response or None if not cached (or the cache is disabled)
+        """
+        if not current_app.config.get(RENDERED_CACHE_TIMEOUT):
+            return None
+        cached = cache.get(self.rendered_cache_key())
+        if cached is None:
+            return None
+        self.rendered = True
+        etag, body, mimetype = cached
+        return self.not_modified(etag) or current_app.response_class(body, mimetype=mimetype)
+
+    def dispatch_request(self, *args, **kwargs):
+        response = super(RenderedCacheMixin, self).dispatch_request(*args, **kwargs)
+        timeout = current_app.config.get(RENDERED_CACHE_TIMEOUT)
+        if (timeout and not self.rendered and self.etag and response.status_code == 200
+                and not response.is_streamed):
+            cache.set(self.rendered_cache_key(), (self.etag, response.get_data(), response.mimetype),
+                      timeout=timeout)
+        return response
+
+
+class Search(HitsMixin, RenderedCacheMixin, ServiceView):
+
+    hits_key = SEARCH_HITS_KEY
+
+    def counts_hit(self):
+        return request.args.get('mode', None) != 'count' and super(Search, self).counts_hit()
 
-    @cache.cached(timeout=60, key_prefix=args_cache_key)
     def handle_request(self):
+        cached = self.cached_response()
+        if cached is not None:
+            return cached
+        if request.args.get('mode', None) == 'count':
+            response = self.handle_count()
+            etag = hashlib.sha1(str(response['size'])).hexdigest()
+        else:
+            response = self.handle_search()
+            digest = hashlib.sha1(str(response['size']))
+            for result in response['results']:
+                digest.update(result.digest())
+            etag = digest.hexdigest()
+        return self.not_modified(etag) or response
+
+    @cache.cached(timeout=COUNT_CACHE_TIMEOUT, key_prefix=count_cache_key)
+    def handle_count(self):
+        title = request.args.get('title', None)
+        author = request.args.get('author', None)
+        isbn = request.args.get('isbn', None)
+
+        try:
+            service = LibrarySearchService.from_context()
+            size = service.count(title, author, isbn)
+        except LibrarySearchQuery.InconsistentQuery as e:
+            raise BadRequest(message=e.msg)
+        else:
+            return {'size': size, 'title': title, 'author': author, 'isbn': isbn}
+
+    @cache.cached(timeout=60, key_prefix=args_cache_key)
+    def handle_search(self):
         # 1. Request from Service
         self.title = request.args.get('title', None)
         self.author = request.args.get('author', None)
@@ -24,40 +149,105 @@ class Search(ServiceView):
         self.availability = get_boolean_value(request.args.get('availability', 'false'))
         self.start = int(request.args.get('start', 0))
         self.count = int(request.args.get('count', 35))
+        self.fields = get_fields_value(request.args.get('fields', None))
 
         try:
             service = LibrarySearchService.from_context()
             size, results = service.search(self.title, self.author, self.isbn,
-                                           self.availability, self.start, self.count)
+                                           self.availability, self.start, self.count,
+                                           fields=self.fields)
             results = list(results)     # necessary for caching (cannot pickle with generators)
         except LibrarySearchQuery.InconsistentQuery as e:
             raise BadRequest(message=e.msg)
         else:
             return {'size': size, 'results': results, 'title': self.title,
                     'author': self.author, 'isbn': self.isbn,
-                    'start': self.start, 'count': self.count}
+                    'start': self.start, 'count': self.count,
+                    'fields': self.fields}
 
     @accepts(HAL_JSON, JSON)
     def as_hal_json(self, response):
+        if 'results' not in response:
+            return HALItemsCountRepresentation(response['title'], response['author'], response['isbn'],
+                                               response['size'], request.url_rule.endpoint).as_json()
         return HALItemsRepresentation(response['title'], response['author'], response['isbn'],
                                       response['results'], response['start'], response['count'], response['size'],
-                                      request.url_rule.endpoint).as_json()
+                                      request.url_rule.endpoint, fields=response.get('fields')).as_json()
 
 
-class ResourceDetail(ServiceView):
+class ResourceDetail(HitsMixin, RenderedCacheMixin, ServiceView):
+
+    hits_key = ITEM_HITS_KEY
 
-    @cache.cached(timeout=60)
     def handle_request(self, id):
+        cached = self.cached_response()
+        if cached is not None:
+            return cached
+        result = self.handle_item(id)
+        return self.not_modified(result.digest()) or result
+
+    @cache.cached(timeout=60, key_prefix=args_cache_key)
+    def handle_item(self, id):
         service = LibrarySearchService.from_context()
         availability = get_boolean_value(request.args.get('availability', 'true'))
-        result = service.get_media(id, availability)
+        fields = get_fields_value(request.args.get('fields', None))
+        result = service.get_media(id, availability, fields=fields)
         if not result:
             raise NotFound()
         return result
 
     @accepts(HAL_JSON, JSON)
     def as_hal_json(self, response):
-        return HALItemRepresentation(response, request.url_rule.endpoint).as_json()
+        fields = get_fields_value(request.args.get('fields', None))
+        return HALItemRepresentation(response, request.url_rule.endpoint, fields=fields).as_json()
+
+
+class Export(ServiceView):
+
+    def handle_request(self):
+        title = request.args.get('title', None)
+        author = request.args.get('author', None)
+        isbn = request.args.get('isbn', None)
+        availability = get_boolean_value(request.args.get('availability', 'false'))
+        poi = get_boolean_value(request.args.get('poi', 'false'))
+        chunk_size = max(1, min(int(request.args.get('chunk', 100)), EXPORT_MAX_CHUNK_SIZE))
+        fields = get_fields_value(request.args.get('fields', None))
+
+        try:
+            service = LibrarySearchService.from_context()
+            size, results = service.export(title, author, isbn, availability, chunk_size,
+                                           fields=fields)
+        except LibrarySearchQuery.InconsistentQuery as e:
+            raise BadRequest(message=e.msg)
+
+        item_endpoint = '{bp}.item'.format(bp=request.blueprint)
+
+        def generate():
+            for result in results:
+                if poi:
+                    item = HALItemRepresentation(result, item_endpoint, fields=fields).as_dict()
+                else:
+                    item = ItemRepresentation(result, fields=fields).as_dict()
+                yield json.dumps(item) + '\n'
+
+        response = current_app.response_class(stream_with_context(generate()),
+                                              mimetype='application/x-ndjson')
+        response.headers['X-Total-Count'] = str(size)
+        return response
+
+
+class Suggestions(ServiceView):
+
+    def handle_request(self):
+        query = request.args.get('q', '')
+        count = max(1, min(int(request.args.get('count', 10)), SUGGESTIONS_MAX_COUNT))
+        service = LibrarySearchService.from_context()
+        return {'q': query, 'suggestions': service.suggest(query, count)}
+
+    @accepts(HAL_JSON, JSON)
+    def as_hal_json(self, response):
+        return HALSuggestionsRepresentation(response['q'], response['suggestions'],
+                                            request.url_rule.endpoint).as_json()
 
 
 def get_boolean_value(s, default=False):
@@ -66,4 +256,19 @@ def get_boolean_value(s, default=False):
         return True
     elif s == 'false':
         return False
-    return default
\ No newline at end of file
+    return default
+
+
+def get_fields_value(s):
+    """Parse a comma-separated list of fields
+    :param s: value of the parameter
+    :return frozenset of fields or None if all fields are requested
+    :raise BadRequest: if a field is unknown
+    """
+    if not s:
+        return None
+    fields = frozenset(f.strip() for f in s.split(',') if f.strip())
+    unknown = fields - LibrarySearchResult.FIELDS
+    if unknown:
+        raise BadRequest(message="Unknown fields: {fields}".format(fields=', '.join(sorted(unknown))))
+    return fields
@@ -0,0 +1,107 @@
+import logging
+import random
+import re
+import time
+from collections import Counter
+
+from moxie.core.kv import kv_store
+
+logger = logging.getLogger(__name__)
+
+SEARCH_HITS_KEY = 'library:hits:search'
+ITEM_HITS_KEY = 'library:hits:item'
+
+# proportion of requests counted, counters only need to rank paths
+HITS_SAMPLE_RATE = 0.1
+
+# maximum number of entries of a hit counter, and probability of trimming
+# the counter when recording a hit
+MAX_HITS = 10000
+HITS_TRIM_PROBABILITY = 0.01
+
+# header sent by requests replayed when warming up, they are not counted
+WARMUP_HEADER = 'X-Moxie-Warmup'
+
+ACCESS_LOG_REQUEST = re.compile(r'"GET (?P<path>\S+) HTTP/[0-9.]+" 200 ')
+
+
+def record_hit(key, path):
+    """Count a request to a path (including query string) so that it can be
+    replayed when warming up caches. Requests are sampled, and the counter is
+    trimmed from time to time to its MAX_HITS most requested paths.
+    :param key: key of the counter (e.g. SEARCH_HITS_KEY)
+    :param path: full path of the request
+    """
+    if random.random() >= HITS_SAMPLE_RATE:
+        return
+    try:
+        kv_store.zincrby(key, path, 1)
+        if random.random() < HITS_TRIM_PROBABILITY:
+            kv_store.zremrangebyrank(key, 0, -MAX_HITS - 1)
+    except Exception:
+        logger.warning("Unable to record hit", exc_info=True)
+
+
+def top_hits(key, top_n):
+    """Most requested paths (counters are trimmed by record_hit)
+    :param key: key of the counter
+    :param top_n: number of paths to return
+    :return list of paths, most requested first
+    """
+    return kv_store.zrevrange(key, 0, top_n - 1)
+
+
+def top_paths_from_log(lines, prefix, top_n):
+    """Most requested paths from an access log (combined log format)
+    :param lines: lines of the access log
+    :param prefix: prefix of paths to consider (e.g. /library/search)
+    :param top_n: number of paths to return
+    :return list of paths, most requested first
+    """
+    counter = Counter()
+    for line in lines:
+        match = ACCESS_LOG_REQUEST.search(line)
+        if match and match.group('path').startswith(prefix):
+            counter[match.group('path')] += 1
+    return [path for path, hits in counter.most_common(top_n)]
+
+
+def warm_cache(app, paths, rate=2.0, accept='application/hal+json'):
+    """Replay requests through the views of the library blueprint, which
+    populates the entries of the cache read by `Search` and `ResourceDetail`
+    :param app: flask application
+    :param paths: full paths to request (e.g. from `top_hits`)
+    :param rate: maximum number of requests per second
+    :param accept: mimetype requested
+    :return number of successful requests
+    """
+    client = app.test_client()
+    interval = 1.0 / rate
+    warmed = 0
+    for path in paths:
+        started = time.time()
+        try:
+            response = client.get(path, headers={'Accept': accept, WARMUP_HEADER: '1'})
+        except Exception:
+            logger.warning("Unable to warm up %s", path, exc_info=True)
+        else:
+            if response.status_code == 200:
+                warmed += 1
+            else:
+                logger.info("Warming up %s returned %d", path, response.status_code)
+        elapsed = time.time() - started
+        if elapsed < interval:
+            time.sleep(interval - elapsed)
+    return warmed
+
+
+def warm_from_hits(app, top_n=100, rate=2.0):
+    """Replay the top searches and items recorded by the views
+    :param app: flask application
+    :param top_n: number of searches and of items to replay
+    :param rate: maximum number of requests per second
+    :return number of successful requests
+    """
+    with app.app_context():
+        paths = top_hits(SEARCH_HITS_KEY, top_n) + top_hits(ITEM_HITS_KEY, top_n)
+    return warm_cache(app, paths, rate=rate)
@@ -5,7 +5,7 @@ install_requires = open('requirements.txt').readlines()
 
 setup(name='moxie-library',
     version='0.1',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     description='Library search module for Moxie',
     author='Mobile Oxford',
     author_email='mobileoxford@oucs.ox.ac.uk',